@@ -8,6 +8,9 @@ and automatically schedules new jobs when GPUs become free.
 
 The scheduler uses a simple polling mechanism to detect free GPUs rather than
 a queuing system like SLURM, making it suitable for standalone workstations.
+On Linux (kernel >= 5.3), the wait for a free GPU blocks on pidfds of the
+launched jobs, so the scheduler wakes as soon as a job exits. Elsewhere it
+waits for SIGCHLD through a self-pipe.
 
 Usage:
     python3 batch_runner.py
@@ -16,25 +19,47 @@ Usage:
 
 Configuration:
     - EXCEL_FILE: Path to Excel file containing job specifications
-    - GPU_COUNT: Number of GPUs available (auto-detected or env var)
+    - GPU_COUNT: Number of GPUs available (env var, otherwise auto-detected on first use)
     - SLEEP_INTERVAL: Seconds between GPU availability checks
 """
 
 import argparse
-import glob
+import fcntl
+import functools
+import heapq
 import os
+import select
+import shutil
+import signal
 import subprocess
 import sys
 import time
-from typing import Dict, List, Optional, Set, Tuple
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
 
-import pandas as pd
+from excel_to_subunits import read_excel_jobs
 
 # Configuration constants
 EXCEL_FILE = "batch_jobs.xlsx"
 SLEEP_INTERVAL = int(os.environ.get("SLEEP_INTERVAL", "10"))  # Seconds between GPU checks
 MESSAGE_INTERVAL = int(os.environ.get("MESSAGE_INTERVAL", "300"))  # Seconds between status messages
 GPU_LOCK_DIR = "/tmp/combfold_gpu_locks"  # Directory for GPU lock files
+GPU_COUNT_CACHE_FILE = "/tmp/combfold_gpu_count"  # Detected GPU count, valid until reboot
+
+# CPU threads used by one assembly (CombinatorialAssembler is single-threaded);
+# the default --max-assemblies is the CPU count divided by this
+ASSEMBLY_THREADS = 1
+
+# Dispatch order of pending jobs: jobs closest to completion run first so they
+# free their GPU quickly (lower value = higher priority)
+STATUS_PRIORITY = {
+    'predictions_done': 0,
+    'fastas_created': 1,
+    'subunits_created': 2,
+    'not_started': 3,
+}
+DEFAULT_STATUS_PRIORITY = 3
 
 # Script paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -44,10 +69,25 @@ RUN_JOB_SCRIPT = os.path.join(SCRIPT_DIR, "run_combfold_job.py")
 DOCKER_IMAGE = os.environ.get("COMBFOLD_DOCKER_IMAGE", "combfold:latest")
 
 
+def get_boot_time() -> Optional[str]:
+    """Get the system boot time from /proc/stat, or None if unavailable."""
+    try:
+        with open("/proc/stat") as f:
+            for line in f:
+                if line.startswith("btime "):
+                    return line.split()[1]
+    except OSError:
+        pass
+    return None
+
+
 def detect_gpu_count() -> int:
     """
     Auto-detect the number of available GPUs using nvidia-smi.
 
+    The detected count is cached in GPU_COUNT_CACHE_FILE together with the
+    system boot time, so nvidia-smi only runs once per boot.
+
     Falls back to GPU_COUNT environment variable or default of 1
     if detection fails.
 
@@ -59,6 +99,17 @@ def detect_gpu_count() -> int:
     if env_count:
         return int(env_count)
 
+    # Reuse the count detected earlier in this boot
+    boot_time = get_boot_time()
+    if boot_time is not None:
+        try:
+            with open(GPU_COUNT_CACHE_FILE, 'r') as f:
+                cached_boot_time, cached_count = f.read().split()
+            if cached_boot_time == boot_time:
+                return int(cached_count)
+        except (OSError, ValueError):
+            pass
+
     # Try auto-detection with nvidia-smi
     try:
         result = subprocess.run(
@@ -70,6 +121,12 @@ def detect_gpu_count() -> int:
         if result.returncode == 0:
             gpu_lines = [l for l in result.stdout.strip().split('\n') if l.startswith('GPU')]
             if gpu_lines:
+                if boot_time is not None:
+                    try:
+                        with open(GPU_COUNT_CACHE_FILE, 'w') as f:
+                            f.write(f"{boot_time}\n{len(gpu_lines)}\n")
+                    except OSError:
+                        pass
                 return len(gpu_lines)
     except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
         pass
@@ -78,7 +135,10 @@ def detect_gpu_count() -> int:
     return 1
 
 
-GPU_COUNT = detect_gpu_count()
+@functools.cache
+def gpu_count() -> int:
+    """Number of available GPUs, detected on first use."""
+    return detect_gpu_count()
 
 
 def parse_args():
@@ -117,9 +177,77 @@ def parse_args():
              "single_sequence (offline, no MSA), mmseqs2_uniref (local server), "
              "local (run colabfold_search on local DB first)"
     )
+    parser.add_argument(
+        "--max-assemblies", type=int, default=None,
+        help="Maximum number of CPU assemblies running at once "
+             "(default: CPU count / threads per assembly)"
+    )
+    parser.add_argument(
+        "--msa-cache-dir", type=str, default=None,
+        help="MSA cache folder shared by all jobs, so chains recurring across jobs "
+             "are searched once (local MSA mode)"
+    )
     return parser.parse_args()
 
 
+def has_file_with_suffix(directory: str, suffix: str) -> bool:
+    """
+    Check whether a directory contains at least one file with the given suffix.
+
+    Stops at the first match instead of listing the whole directory.
+
+    Args:
+        directory: Directory to scan
+        suffix: Filename suffix (e.g. '.pdb')
+
+    Returns:
+        True if a matching entry exists, False otherwise (including missing directory)
+    """
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    return True
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return False
+
+
+# Cache of computed job statuses: job_dir -> (directory mtimes, status)
+_status_cache: Dict[str, Tuple[Tuple[int, ...], str]] = {}
+
+# Job subdirectories whose contents determine the status
+_STATUS_SUBDIRS = ("fastas", "pdbs", os.path.join("output", "assembled_results"))
+
+
+def get_job_dir_signature(job_dir: str) -> Optional[Tuple[int, ...]]:
+    """
+    Get the modification times of a job directory and its status subdirectories.
+
+    Adding or removing files in any of these directories changes the
+    signature, which invalidates the cached status.
+
+    Args:
+        job_dir: Job directory
+
+    Returns:
+        Tuple of mtimes in nanoseconds (0 for missing subdirectories),
+        or None if the job directory does not exist
+    """
+    try:
+        signature = [os.stat(job_dir).st_mtime_ns]
+    except FileNotFoundError:
+        return None
+
+    for subdir in _STATUS_SUBDIRS:
+        try:
+            signature.append(os.stat(os.path.join(job_dir, subdir)).st_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError):
+            signature.append(0)
+
+    return tuple(signature)
+
+
 def get_job_status(job_id: str, output_dir: str = "results") -> str:
     """
     Check the completion status of a job.
@@ -132,6 +260,8 @@ def get_job_status(job_id: str, output_dir: str = "results") -> str:
     - 'incomplete': Job started but partial
     - 'not_started': No job directory
 
+    Results are cached and reused while the job directories are unchanged.
+
     Args:
         job_id: Complex_ID of the job
         output_dir: Base output directory
@@ -141,31 +271,61 @@ def get_job_status(job_id: str, output_dir: str = "results") -> str:
     """
     job_dir = os.path.join(output_dir, job_id)
 
-    if not os.path.exists(job_dir):
+    signature = get_job_dir_signature(job_dir)
+    if signature is None:
+        _status_cache.pop(job_dir, None)
+        return 'not_started'
+
+    cached = _status_cache.get(job_dir)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    status = scan_job_status(job_dir)
+    _status_cache[job_dir] = (signature, status)
+    return status
+
+
+def invalidate_job_status(job_id: str, output_dir: str = "results"):
+    """Drop the cached status of a job (e.g. when it is relaunched)."""
+    _status_cache.pop(os.path.join(output_dir, job_id), None)
+
+
+def scan_job_status(job_dir: str) -> str:
+    """
+    Determine the status of a job by scanning its directory.
+
+    Args:
+        job_dir: Job directory
+
+    Returns:
+        Status string (see get_job_status)
+    """
+    # One directory listing replaces the separate exists() checks
+    try:
+        with os.scandir(job_dir) as it:
+            names = {entry.name for entry in it}
+    except FileNotFoundError:
         return 'not_started'
 
     # Check for subunits.json
-    subunits_path = os.path.join(job_dir, "subunits.json")
-    if not os.path.exists(subunits_path):
+    if "subunits.json" not in names:
         return 'incomplete'
 
     # Check for FASTAs
-    fastas_dir = os.path.join(job_dir, "fastas")
-    has_fastas = os.path.exists(fastas_dir) and len(glob.glob(os.path.join(fastas_dir, "*.fasta"))) > 0
+    has_fastas = "fastas" in names and has_file_with_suffix(os.path.join(job_dir, "fastas"), ".fasta")
 
     if not has_fastas:
         return 'subunits_created'
 
     # Check for PDBs
-    pdbs_dir = os.path.join(job_dir, "pdbs")
-    has_pdbs = os.path.exists(pdbs_dir) and len(glob.glob(os.path.join(pdbs_dir, "*.pdb"))) > 0
+    has_pdbs = "pdbs" in names and has_file_with_suffix(os.path.join(job_dir, "pdbs"), ".pdb")
 
     if not has_pdbs:
         return 'fastas_created'
 
     # Check for assembly results
     assembled_dir = os.path.join(job_dir, "output", "assembled_results")
-    has_results = os.path.exists(assembled_dir) and len(glob.glob(os.path.join(assembled_dir, "*.pdb"))) > 0
+    has_results = "output" in names and has_file_with_suffix(assembled_dir, ".pdb")
 
     if has_results:
         return 'completed'
@@ -173,20 +333,9 @@ def get_job_status(job_id: str, output_dir: str = "results") -> str:
     return 'predictions_done'
 
 
-# Cache for completed jobs
-_completed_jobs_cache: Set[str] = set()
-
-
 def is_job_completed(job_id: str, output_dir: str = "results") -> bool:
-    """Check if job is completed (with caching)."""
-    if job_id in _completed_jobs_cache:
-        return True
-
-    status = get_job_status(job_id, output_dir)
-    if status == 'completed':
-        _completed_jobs_cache.add(job_id)
-        return True
-    return False
+    """Check if job is completed."""
+    return get_job_status(job_id, output_dir) == 'completed'
 
 
 def ensure_lock_dir():
@@ -199,11 +348,42 @@ def get_gpu_lock_file(gpu_id: int) -> str:
     return os.path.join(GPU_LOCK_DIR, f"gpu_{gpu_id}.lock")
 
 
-# Track active subprocesses for reaping zombies
-_active_processes: Dict[int, subprocess.Popen] = {}  # gpu_id -> subprocess.Popen
+@dataclass(slots=True)
+class JobSlot:
+    """A job running on a GPU."""
+    proc: subprocess.Popen          # Job process (reaped when finished)
+    job_id: str                     # Complex_ID, for timing reports
+    start: float                    # Launch time (time.time())
+    pidfd: Optional[int]            # Process fd for event-driven waiting (Linux >= 5.3)
+    lock_fd: Optional[int]          # Held GPU lock fd (the lock is released when closed)
+    assembly_cmd: Optional[List[str]] = None  # Assembly to run on the CPU after the GPU stages
+
+
+# Jobs launched by this runner, indexed by GPU ID (None = no job of ours)
+_slots: List[Optional[JobSlot]] = []
+
+# Assembly stages of jobs whose GPU stages finished. They run on the CPU
+# without a GPU lock, so the next job's predictions overlap with them.
+_assemblies: List[JobSlot] = []
 
-# Track job info for timing reports
-_job_info: Dict[int, Tuple[str, float]] = {}  # gpu_id -> (job_id, start_time)
+# Assemblies waiting for one of the _max_assemblies running ones to finish
+_assembly_queue: Deque[JobSlot] = deque()
+_max_assemblies = 1
+
+# Job IDs whose job or assembly process exited with an error
+_failed_jobs: List[str] = []
+
+_epoll: Optional["select.epoll"] = None
+
+# Read end of the self-pipe written on SIGCHLD (fallback when pidfds are unavailable)
+_sigchld_fd: Optional[int] = None
+
+
+def get_slots() -> List[Optional[JobSlot]]:
+    """Get the per-GPU job slots, sizing them on first use."""
+    if not _slots:
+        _slots.extend([None] * gpu_count())
+    return _slots
 
 
 def format_duration(seconds: float) -> str:
@@ -222,29 +402,176 @@ def reap_finished_processes():
     """
     Reap any finished child processes to prevent zombies.
 
-    Also prints job completion time when a job finishes.
+    Also prints job completion time when a job finishes, records failed jobs
+    and starts queued assemblies while fewer than _max_assemblies run.
+    """
+    slots = get_slots()
+    queued_now = 0
+    for gpu_id, slot in enumerate(slots):
+        if slot is None or slot.proc.poll() is None:
+            continue
+
+        elapsed = time.time() - slot.start
+        if slot.proc.returncode != 0:
+            print(f"   GPU{gpu_id} FAILED: {slot.job_id} (exit code {slot.proc.returncode}, "
+                  f"{format_duration(elapsed)})", flush=True)
+            _failed_jobs.append(slot.job_id)
+        elif slot.assembly_cmd is not None:
+            print(f"   GPU{gpu_id} predictions done: {slot.job_id} ({format_duration(elapsed)}), "
+                  f"assembling on CPU", flush=True)
+            _assembly_queue.append(slot)
+            queued_now += 1
+        else:
+            print(f"   GPU{gpu_id} completed: {slot.job_id} ({format_duration(elapsed)})", flush=True)
+
+        if slot.pidfd is not None:
+            unregister_pidfd(slot.pidfd)
+        os.close(slot.lock_fd)
+        slots[gpu_id] = None
+
+    for assembly in list(_assemblies):
+        if assembly.proc.poll() is not None:
+            elapsed = time.time() - assembly.start
+            if assembly.proc.returncode != 0:
+                print(f"   Assembly FAILED: {assembly.job_id} (exit code {assembly.proc.returncode}, "
+                      f"{format_duration(elapsed)})", flush=True)
+                _failed_jobs.append(assembly.job_id)
+            else:
+                print(f"   Assembly completed: {assembly.job_id} ({format_duration(elapsed)})", flush=True)
+            if assembly.pidfd is not None:
+                unregister_pidfd(assembly.pidfd)
+            _assemblies.remove(assembly)
+
+    while _assembly_queue and len(_assemblies) < _max_assemblies:
+        start_assembly(_assembly_queue.popleft())
+    if queued_now and _assembly_queue:
+        print(f"   Assemblies queued: {len(_assembly_queue)} ({len(_assemblies)} running, "
+              f"--max-assemblies {_max_assemblies})", flush=True)
+
+
+def start_assembly(slot: JobSlot):
+    """
+    Launch the assembly stage of a job whose GPU stages finished.
+
+    Args:
+        slot: Slot of the finished GPU stages
+    """
+    proc = subprocess.Popen(slot.assembly_cmd)
+    pidfd = register_pidfd(proc)
+    if pidfd is None:
+        install_sigchld_wakeup()
+    _assemblies.append(JobSlot(
+        proc=proc,
+        job_id=slot.job_id,
+        start=slot.start,
+        pidfd=pidfd,
+        lock_fd=None,
+    ))
+
+
+def register_pidfd(proc: subprocess.Popen) -> Optional[int]:
     """
-    finished = []
-    for gpu_id, proc in _active_processes.items():
-        if proc.poll() is not None:  # Process has finished
-            finished.append(gpu_id)
+    Open a pidfd for a launched job and register it for event-driven waiting.
+
+    Returns None when pidfds are not supported (Python < 3.9, non-Linux,
+    or kernel < 5.3); wait_for_job_exit() then falls back to sleeping.
+
+    Args:
+        proc: Launched job process
 
-    for gpu_id in finished:
-        # Print completion time if we have job info
-        if gpu_id in _job_info:
-            job_id, start_time = _job_info[gpu_id]
-            elapsed = time.time() - start_time
-            print(f"   GPU{gpu_id} completed: {job_id} ({format_duration(elapsed)})", flush=True)
-            del _job_info[gpu_id]
+    Returns:
+        The registered pidfd, or None
+    """
+    global _epoll
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        return None
+
+    try:
+        if _epoll is None:
+            _epoll = select.epoll()
+        _epoll.register(pidfd, select.EPOLLIN)
+    except (AttributeError, OSError):
+        os.close(pidfd)
+        return None
+
+    return pidfd
+
+
+def unregister_pidfd(pidfd: int):
+    """Unregister and close the pidfd of a finished job."""
+    try:
+        _epoll.unregister(pidfd)
+    except (OSError, ValueError):
+        pass
+    os.close(pidfd)
+
+
+def install_sigchld_wakeup() -> bool:
+    """
+    Route SIGCHLD to a self-pipe so waits can wake up when a job exits.
+
+    Returns:
+        True if the self-pipe is installed (only possible in the main thread)
+    """
+    global _sigchld_fd
+    if _sigchld_fd is not None:
+        return True
+
+    read_fd, write_fd = os.pipe()
+    try:
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        # The handler itself does nothing; reaping happens in the main loop
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.set_wakeup_fd(write_fd)
+    except (ValueError, OSError):
+        os.close(read_fd)
+        os.close(write_fd)
+        return False
+
+    _sigchld_fd = read_fd
+    return True
+
+
+def wait_for_job_exit(busy: Set[int]) -> None:
+    """
+    Block until a launched job exits or the wait times out.
+
+    Waits on the jobs' pidfds, or on SIGCHLD when pidfds are unavailable.
+    When every busy GPU is held by one of our own jobs, blocks for up to
+    MESSAGE_INTERVAL and wakes the instant any job exits. GPUs locked by
+    processes we cannot watch (e.g. another batch runner) are still polled
+    every SLEEP_INTERVAL seconds.
+
+    Args:
+        busy: GPU IDs currently in use
+    """
+    slots = get_slots()
+    own = {gpu_id for gpu_id, slot in enumerate(slots) if slot is not None}
+    jobs = [slot for slot in slots if slot is not None] + _assemblies
 
-        del _active_processes[gpu_id]
+    if jobs and busy.issubset(own):
+        timeout = MESSAGE_INTERVAL
+    else:
+        timeout = SLEEP_INTERVAL
 
-        # Clean up the lock file
-        lock_file = get_gpu_lock_file(gpu_id)
+    if _epoll is not None and jobs and all(job.pidfd is not None for job in jobs):
+        try:
+            _epoll.poll(timeout)
+        except InterruptedError:
+            pass
+    elif jobs and install_sigchld_wakeup():
+        select.select([_sigchld_fd], [], [], timeout)
+        # Drain wakeup bytes; finished jobs are reaped by the caller
         try:
-            os.remove(lock_file)
-        except FileNotFoundError:
+            while os.read(_sigchld_fd, 512):
+                pass
+        except BlockingIOError:
             pass
+    else:
+        time.sleep(SLEEP_INTERVAL)
 
 
 def get_running_jobs() -> Set[int]:
@@ -257,55 +584,84 @@ def get_running_jobs() -> Set[int]:
     # First, reap any finished processes
     reap_finished_processes()
 
-    ensure_lock_dir()
     busy_gpus: Set[int] = set()
 
-    for gpu_id in range(GPU_COUNT):
-        lock_file = get_gpu_lock_file(gpu_id)
-        if os.path.exists(lock_file):
-            # Check if the lock is stale
-            try:
-                with open(lock_file, 'r') as f:
-                    pid = int(f.read().strip())
-                # Check if process is still running
-                os.kill(pid, 0)  # Raises OSError if process doesn't exist
-                busy_gpus.add(gpu_id)
-            except (ValueError, OSError, FileNotFoundError):
-                # Lock is stale, remove it
-                try:
-                    os.remove(lock_file)
-                except FileNotFoundError:
-                    pass
+    for gpu_id in range(gpu_count()):
+        if is_gpu_locked(gpu_id):
+            busy_gpus.add(gpu_id)
 
     return busy_gpus
 
 
-def find_free_gpu() -> Optional[int]:
+def find_free_gpu_and_busy() -> Tuple[Optional[int], Set[int]]:
     """
     Find an available GPU that is not currently running a job.
 
     Returns:
-        int or None: GPU ID if available, None if all GPUs are busy
+        Tuple of (GPU ID if available or None if all GPUs are busy,
+        set of busy GPU IDs)
     """
     busy = get_running_jobs()
-    for gpu_id in range(GPU_COUNT):
-        if gpu_id not in busy:
-            return gpu_id
-    return None
+    free_gpu = next((gpu_id for gpu_id in range(gpu_count()) if gpu_id not in busy), None)
+    return free_gpu, busy
 
 
-def acquire_gpu_lock(gpu_id: int, pid: int):
+def is_gpu_locked(gpu_id: int) -> bool:
+    """
+    Check whether a GPU lock is held by any process.
+
+    Locks are flock()s held by the job process for its whole lifetime, so
+    the kernel releases them automatically when the job exits or is killed.
+
+    Args:
+        gpu_id: GPU ID to check
+
+    Returns:
+        True if the GPU is locked
+    """
+    try:
+        fd = os.open(get_gpu_lock_file(gpu_id), os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+    return False
+
+
+def acquire_gpu_lock(gpu_id: int) -> Optional[int]:
     """
     Acquire a lock for a GPU.
 
+    The returned file descriptor must be passed to the job process so that it
+    keeps holding the lock after the batch runner exits.
+
     Args:
         gpu_id: GPU ID to lock
-        pid: Process ID holding the lock
+
+    Returns:
+        Lock file descriptor, or None if the GPU is already locked
     """
     ensure_lock_dir()
-    lock_file = get_gpu_lock_file(gpu_id)
-    with open(lock_file, 'w') as f:
-        f.write(str(pid))
+    fd = os.open(get_gpu_lock_file(gpu_id), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+    return fd
+
+
+def write_gpu_lock_pid(lock_fd: int, pid: int):
+    """Record the PID of the job holding a GPU lock (informational only)."""
+    os.ftruncate(lock_fd, 0)
+    os.pwrite(lock_fd, str(pid).encode(), 0)
 
 
 def is_inside_docker() -> bool:
@@ -350,7 +706,9 @@ def launch_in_docker(args):
     print(f"   Excel mount: {excel_path} -> /data/batch_jobs.xlsx")
     print(f"   Results mount: {script_dir}/results -> /data/results")
 
-    os.execvp("docker", cmd)
+    # Resolve docker once instead of letting execvp() search PATH
+    docker_bin = shutil.which("docker") or "/usr/bin/docker"
+    os.execv(docker_bin, cmd)
 
 
 def main():
@@ -363,7 +721,12 @@ def main():
 
     Jobs are launched asynchronously on available GPUs.
     """
+    global _max_assemblies
     args = parse_args()
+    if args.max_assemblies is not None:
+        _max_assemblies = max(1, args.max_assemblies)
+    else:
+        _max_assemblies = max(1, (os.cpu_count() or 1) // ASSEMBLY_THREADS)
 
     # Get force rerun from environment (for Docker mode)
     force_rerun = args.force or os.environ.get("CF_FORCE_RERUN", "0") == "1"
@@ -373,7 +736,7 @@ def main():
         print(f"ERROR: Excel file not found: {args.excel}")
         sys.exit(1)
 
-    df = pd.read_excel(args.excel)
+    df = read_excel_jobs(args.excel)
 
     if "Complex_ID" not in df.columns:
         raise ValueError("Excel file must contain 'Complex_ID' column")
@@ -389,22 +752,26 @@ def main():
     completed_count = 0
     incomplete_count = 0
     skipped_count = 0
-    pending_jobs: List[Tuple[str, List[str], str]] = []  # (job_id, sequences, status)
+    # Heap of (priority, row_index, job_id, sequences, status); row_index keeps
+    # Excel order among jobs of equal priority
+    pending_jobs: List[Tuple[int, int, str, List[str], str]] = []
+
+    # Clean the whole sheet column-wise instead of boxing every row into a Series
+    job_ids = df["Complex_ID"].to_numpy(dtype=object)
+    chains = df[chain_columns].apply(lambda col: col.astype("string").str.strip()).fillna("")
+    chain_values = chains.to_numpy(dtype=object)
+    chain_mask = (chains != "").to_numpy(dtype=bool)
 
-    for idx, row in df.iterrows():
-        job_id = str(row["Complex_ID"]).strip()
-        status = get_job_status(job_id, args.output_dir)
+    statuses = [get_job_status(job_id, args.output_dir) for job_id in job_ids]
 
+    for row_index, (job_id, status, row_values, row_mask) in enumerate(
+            zip(job_ids, statuses, chain_values, chain_mask)):
         if status == 'completed' and not force_rerun:
             completed_count += 1
             continue
 
         # Extract sequences
-        seqs = [
-            str(row[col]).strip()
-            for col in chain_columns
-            if pd.notna(row[col]) and str(row[col]).strip()
-        ]
+        seqs = row_values[row_mask].tolist()
 
         if not seqs:
             skipped_count += 1
@@ -413,7 +780,12 @@ def main():
         if status in ['predictions_done', 'fastas_created', 'subunits_created']:
             incomplete_count += 1
 
-        pending_jobs.append((job_id, seqs, status))
+        priority = STATUS_PRIORITY.get(status, DEFAULT_STATUS_PRIORITY)
+        heapq.heappush(pending_jobs, (priority, row_index, job_id, seqs, status))
+
+    # Only pending_jobs is needed from here on. Dropping the sheet keeps the
+    # long-running parent small for every job launch below.
+    del df, chains, chain_values, chain_mask
 
     # Show startup summary
     print("=" * 60)
@@ -427,11 +799,13 @@ def main():
     if skipped_count > 0:
         print(f"   Skipped (no seq):  {skipped_count}")
     print(f"   Jobs to process:   {len(pending_jobs)}")
-    print(f"   GPUs available:    {GPU_COUNT} (auto-detected)")
+    print(f"   GPUs available:    {gpu_count()} (auto-detected)")
     print(f"   Poll interval:     {SLEEP_INTERVAL}s")
     print(f"   Chain columns:     {chain_columns}")
     print(f"   Skip AFM:          {args.skip_afm}")
     print(f"   MSA Mode:          {args.msa_mode}")
+    if not args.skip_afm:
+        print(f"   Max assemblies:    {_max_assemblies}")
     if args.msa_mode == "single_sequence":
         print(f"   WARNING:           No MSA - predictions may be less accurate")
     elif args.msa_mode == "local":
@@ -445,22 +819,27 @@ def main():
         return
 
     # Process pending jobs
-    for job_num, (job_id, seqs, status) in enumerate(pending_jobs, 1):
+    total_pending = len(pending_jobs)
+    job_num = 0
+    while pending_jobs:
+        _, _, job_id, seqs, status = heapq.heappop(pending_jobs)
+        job_num += 1
+
         # Wait for an available GPU
-        wait_time = 0
+        wait_start = time.time()
+        next_message = MESSAGE_INTERVAL
         printed_initial = False
 
         while True:
-            gpu_id = find_free_gpu()
+            gpu_id, busy = find_free_gpu_and_busy()
             if gpu_id is not None:
-                busy = get_running_jobs()
-                free_count = GPU_COUNT - len(busy)
+                free_count = gpu_count() - len(busy)
 
                 # Show status message
                 if status != 'not_started':
-                    print(f"\n[{job_num}/{len(pending_jobs)}] {job_id} -> GPU{gpu_id} (resuming from {status})", flush=True)
+                    print(f"\n[{job_num}/{total_pending}] {job_id} -> GPU{gpu_id} (resuming from {status})", flush=True)
                 else:
-                    print(f"\n[{job_num}/{len(pending_jobs)}] {job_id} -> GPU{gpu_id} (free: {free_count}/{GPU_COUNT})", flush=True)
+                    print(f"\n[{job_num}/{total_pending}] {job_id} -> GPU{gpu_id} (free: {free_count}/{gpu_count()})", flush=True)
 
                 # Build command
                 cmd = [
@@ -473,45 +852,77 @@ def main():
                     "--msa_mode", args.msa_mode,
                     "--sequences", *seqs
                 ]
+                if args.msa_cache_dir:
+                    cmd.extend(["--msa_cache_dir", args.msa_cache_dir])
                 if args.skip_afm:
                     cmd.append("--skip_afm")
-
-                # Launch job asynchronously
-                proc = subprocess.Popen(cmd)
+                    assembly_cmd = None
+                else:
+                    # Assemble in a separate process once the GPU stages are done,
+                    # so the GPU is released for the next job meanwhile
+                    assembly_cmd = cmd + ["--skip_afm"]
+                    cmd.append("--skip_assembly")
+
+                # Acquire GPU lock (another runner may have taken the GPU meanwhile)
+                lock_fd = acquire_gpu_lock(gpu_id)
+                if lock_fd is None:
+                    continue
+
+                # Launch job asynchronously; the job inherits and holds the lock.
+                # CPython >= 3.10 spawns via vfork(), so the parent's page tables
+                # are not copied.
+                invalidate_job_status(job_id, args.output_dir)
+                proc = subprocess.Popen(cmd, pass_fds=(lock_fd,))
 
                 # Track process
-                _active_processes[gpu_id] = proc
-                _job_info[gpu_id] = (job_id, time.time())
-
-                # Acquire GPU lock
-                acquire_gpu_lock(gpu_id, proc.pid)
+                write_gpu_lock_pid(lock_fd, proc.pid)
+                pidfd = register_pidfd(proc)
+                if pidfd is None:
+                    install_sigchld_wakeup()
+                get_slots()[gpu_id] = JobSlot(
+                    proc=proc,
+                    job_id=job_id,
+                    start=time.time(),
+                    pidfd=pidfd,
+                    lock_fd=lock_fd,
+                    assembly_cmd=assembly_cmd,
+                )
                 break
             else:
                 # All GPUs busy
-                busy = get_running_jobs()
                 if not printed_initial:
-                    print(f"\n[{job_num}/{len(pending_jobs)}] {job_id} waiting for GPU... (busy: {sorted(busy)})", flush=True)
+                    print(f"\n[{job_num}/{total_pending}] {job_id} waiting for GPU... (busy: {sorted(busy)})", flush=True)
                     printed_initial = True
-                elif wait_time > 0 and wait_time % MESSAGE_INTERVAL == 0:
-                    print(f"   ... still waiting ({wait_time}s, busy: {sorted(busy)})", flush=True)
-                wait_time += SLEEP_INTERVAL
-                time.sleep(SLEEP_INTERVAL)
+                else:
+                    wait_time = int(time.time() - wait_start)
+                    if wait_time >= next_message:
+                        print(f"   ... still waiting ({wait_time}s, busy: {sorted(busy)})", flush=True)
+                        next_message += MESSAGE_INTERVAL
+                wait_for_job_exit(busy)
 
     print("\nAll jobs have been submitted")
 
     # Wait for all jobs to complete
     print("\nWaiting for all jobs to complete...")
-    while _active_processes:
+    while any(get_slots()) or _assemblies or _assembly_queue:
         reap_finished_processes()
 
-        remaining = list(_active_processes.keys())
+        remaining = [gpu_id for gpu_id, slot in enumerate(get_slots()) if slot is not None]
         if remaining:
-            remaining_jobs = [_job_info.get(gpu, (f"GPU{gpu}", 0))[0] for gpu in remaining]
+            remaining_jobs = [get_slots()[gpu_id].job_id for gpu_id in remaining]
             print(f"   Running: {', '.join(remaining_jobs)} (GPUs: {remaining})", flush=True)
-            time.sleep(SLEEP_INTERVAL)
+        if _assemblies:
+            print(f"   Assembling: {', '.join(assembly.job_id for assembly in _assemblies)}", flush=True)
+        if _assembly_queue:
+            print(f"   Assemblies queued: {len(_assembly_queue)}", flush=True)
+        if remaining or _assemblies:
+            wait_for_job_exit(set(remaining))
 
     print("\n" + "=" * 60)
-    print("All jobs completed!")
+    if _failed_jobs:
+        print(f"All jobs finished, {len(_failed_jobs)} failed: {', '.join(_failed_jobs)}")
+    else:
+        print("All jobs completed!")
     print("=" * 60)
 
 
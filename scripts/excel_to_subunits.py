@@ -14,20 +14,80 @@ Large sequences can be automatically split into domains using --max-af-size.
 """
 
 import argparse
-import json
+import os
+import re
 import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List
 
 import pandas as pd
 
 # Import splitting functionality
-from split_large_subunits import split_subunits_for_af_size, needs_splitting
+from split_large_subunits import dump_json, maybe_split_subunits_for_af_size
+
+
+def write_json(path, data):
+    """
+    Write data as indented JSON to a file.
+
+    The document is serialized once into a buffer and written with raw
+    os.write() calls, bypassing the buffered text I/O layer.
+
+    Args:
+        path: Output file path
+        data: JSON-serializable data
+    """
+    view = memoryview(dump_json(data))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def is_job_column(column) -> bool:
+    """Check whether an Excel column is used for jobs (Complex_ID or Chain_*)."""
+    column = str(column)
+    return column == "Complex_ID" or column.startswith("Chain_")
+
+
+def read_excel_jobs(excel_path: str) -> pd.DataFrame:
+    """
+    Read the Complex_ID and Chain_* columns of a job Excel file as strings.
+
+    Uses the Rust-based calamine engine when python-calamine is installed,
+    falling back to pandas' default engine (openpyxl) otherwise.
+
+    Args:
+        excel_path: Path to the Excel file
+
+    Returns:
+        DataFrame with only the job columns, with Complex_ID stripped
+        (empty Chain_* cells are NaN)
+    """
+    try:
+        df = pd.read_excel(excel_path, engine="calamine", usecols=is_job_column, dtype=str)
+    except (ImportError, ValueError):
+        # python-calamine not installed, or pandas too old for the engine
+        df = pd.read_excel(excel_path, usecols=is_job_column, dtype=str)
+
+    if "Complex_ID" in df.columns:
+        # Missing IDs become "nan", as str() of an empty cell always did
+        df["Complex_ID"] = df["Complex_ID"].astype("string").fillna("nan").str.strip()
+
+    return df
+
+
+# Characters not allowed in subunit identifiers
+_INVALID_NAME_CHARS = re.compile(r"[^0-9A-Za-z_]")
 
 
 def sanitize_name(name: str) -> str:
     """Convert a name to a valid subunit identifier (alphanumeric + underscores)."""
-    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+    return _INVALID_NAME_CHARS.sub("_", name)
 
 
 def row_to_subunits(complex_id: str, sequences: Dict[str, str]) -> dict:
@@ -45,26 +105,25 @@ def row_to_subunits(complex_id: str, sequences: Dict[str, str]) -> dict:
     """
     complex_id = sanitize_name(complex_id)
 
-    # Normalize sequences to uppercase
-    chains_data = {k: v.strip().upper() for k, v in sequences.items() if v and v.strip()}
+    # Normalize sequences to uppercase and group chains by unique sequence
+    # (for homo-oligomer detection)
+    seq_to_chains: Dict[str, List[str]] = defaultdict(list)
+    for chain_letter, seq in sequences.items():
+        if seq:
+            seq = seq.strip().upper()
+            if seq:
+                seq_to_chains[seq].append(chain_letter)
 
-    if not chains_data:
+    if not seq_to_chains:
         raise ValueError(f"No valid sequences provided for {complex_id}")
 
-    # Group chains by unique sequences (for homo-oligomer detection)
-    seq_to_chains: Dict[str, List[str]] = {}
-    for chain_letter, seq in chains_data.items():
-        if seq not in seq_to_chains:
-            seq_to_chains[seq] = []
-        seq_to_chains[seq].append(chain_letter)
-
     # Create subunits
     subunits = {}
 
     if len(seq_to_chains) == 1:
         # Homo-oligomer: all chains have the same sequence
-        seq = list(seq_to_chains.keys())[0]
-        chain_names = sorted(seq_to_chains[seq])
+        seq, chain_names = next(iter(seq_to_chains.items()))
+        chain_names = sorted(chain_names)
 
         subunit_name = f"{complex_id}"
         subunits[subunit_name] = {
@@ -122,7 +181,7 @@ def excel_to_subunits(excel_path: str, output_path: str = None, split: bool = Fa
         Dictionary mapping complex_id to subunits dict (if split=True)
         or single merged subunits dict (if split=False, only valid for single complex)
     """
-    df = pd.read_excel(excel_path)
+    df = read_excel_jobs(excel_path)
 
     # Find chain columns (columns starting with "Chain_")
     chain_cols = [col for col in df.columns if col.startswith("Chain_")]
@@ -135,16 +194,14 @@ def excel_to_subunits(excel_path: str, output_path: str = None, split: bool = Fa
 
     all_complexes = {}  # complex_id -> subunits dict
 
-    for idx, row in df.iterrows():
-        complex_id = sanitize_name(str(row["Complex_ID"]))
+    # Normalize all sequences column-wise (empty/NaN cells become "")
+    complex_ids = df["Complex_ID"].str.replace(_INVALID_NAME_CHARS, "_", regex=True).to_numpy(dtype=object)
+    chains = df[chain_cols].apply(lambda col: col.astype("string").str.strip().str.upper()).fillna("")
+    chain_letters = [col[len("Chain_"):] for col in chain_cols]
 
+    for complex_id, row_values in zip(complex_ids, chains.to_numpy(dtype=object)):
         # Collect all chains and their sequences (skip empty/NaN)
-        chains_data = {}
-        for col in chain_cols:
-            seq = row[col]
-            if pd.notna(seq) and str(seq).strip():
-                chain_letter = col.replace("Chain_", "")
-                chains_data[chain_letter] = str(seq).strip().upper()
+        chains_data = {letter: seq for letter, seq in zip(chain_letters, row_values) if seq}
 
         if not chains_data:
             print(f"Warning: No sequences found for {complex_id}, skipping.")
@@ -154,9 +211,10 @@ def excel_to_subunits(excel_path: str, output_path: str = None, split: bool = Fa
         subunits = row_to_subunits(complex_id, chains_data)
 
         # Split large sequences into domains if max_af_size is set
-        if max_af_size and needs_splitting(subunits, max_af_size):
-            print(f"  {complex_id}: Splitting large sequences (max_af_size={max_af_size})...")
-            subunits = split_subunits_for_af_size(subunits, max_af_size, verbose=True)
+        if max_af_size:
+            subunits, _ = maybe_split_subunits_for_af_size(
+                subunits, max_af_size, verbose=True,
+                header=f"  {complex_id}: Splitting large sequences (max_af_size={max_af_size})...")
 
         all_complexes[complex_id] = subunits
 
@@ -167,13 +225,19 @@ def excel_to_subunits(excel_path: str, output_path: str = None, split: bool = Fa
             output_dir = Path(output_path)
             output_dir.mkdir(parents=True, exist_ok=True)
 
-            for complex_id, subunits in all_complexes.items():
+            def write_complex(item) -> Path:
+                complex_id, subunits = item
                 complex_dir = output_dir / complex_id
                 complex_dir.mkdir(parents=True, exist_ok=True)
                 out_file = complex_dir / "subunits.json"
-                with open(out_file, "w") as f:
-                    json.dump(subunits, f, indent=2)
-                print(f"Saved: {out_file}")
+                write_json(out_file, subunits)
+                return out_file
+
+            # Overlap the per-complex mkdir/write syscalls (threads release the GIL)
+            if all_complexes:
+                with ThreadPoolExecutor(max_workers=min(32, len(all_complexes))) as executor:
+                    saved = list(executor.map(write_complex, all_complexes.items()))
+                print("\n".join(f"Saved: {out_file}" for out_file in saved))
 
             print(f"\nTotal complexes: {len(all_complexes)}")
         else:
@@ -186,8 +250,7 @@ def excel_to_subunits(excel_path: str, output_path: str = None, split: bool = Fa
             for subunits in all_complexes.values():
                 merged.update(subunits)
 
-            with open(output_path, "w") as f:
-                json.dump(merged, f, indent=2)
+            write_json(output_path, merged)
             print(f"Saved subunits.json to: {output_path}")
             print(f"Total subunits: {len(merged)}")
 
@@ -22,13 +22,45 @@ Usage:
 """
 
 import argparse
-import glob
+import errno
+import functools
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import multiprocessing.connection
 import os
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Timeout per predicted input (2 hours)
+PREDICTION_TIMEOUT = 7200
+
+# Completed predictions of a pdbs folder, keyed by sequence hash
+CACHE_FILE = ".combfold_cache.json"
+
+# Lines of ColabFold output kept for error messages
+OUTPUT_TAIL_LINES = 500
+
+# Seconds a ColabFold worker process is given to exit before it is killed
+WORKER_STOP_TIMEOUT = 10
+
+# Query length buckets, each predicted by its own ColabFold batch so one
+# oversized input cannot run the whole batch out of GPU memory
+LENGTH_BUCKET_EDGES = (200, 400, 800, 1600)
+
+# Inputs longer than this are predicted with a reduced MSA depth
+# (--max-seq/--max-extra-seq) to fit in GPU memory
+LARGE_INPUT_LENGTH = 1600
+LARGE_INPUT_MAX_SEQ = 256
+LARGE_INPUT_MAX_EXTRA_SEQ = 512
 
 
 def is_inside_docker() -> bool:
@@ -47,7 +79,58 @@ def get_colabfold_command() -> List[str]:
     return ["colabfold_batch"]
 
 
-def get_prediction_status(fasta_name: str, output_folder: str, num_models: int) -> str:
+def list_rank_pdbs(folder: str, name: str) -> List[str]:
+    """
+    List the ranked ColabFold PDBs of an input in a folder.
+
+    ColabFold output naming: {name}_unrelaxed_rank_{rank}_..._model_{model}_....pdb
+    or: {name}_relaxed_rank_{rank}_..._model_{model}_....pdb
+
+    Args:
+        folder: Folder to scan
+        name: Input name (FASTA/A3M filename without extension)
+
+    Returns:
+        Matching filenames (without folder)
+    """
+    prefixes = (f"{name}_unrelaxed_rank_", f"{name}_relaxed_rank_")
+    try:
+        with os.scandir(folder) as entries:
+            return [entry.name for entry in entries
+                    if entry.name.startswith(prefixes) and entry.name.endswith(".pdb") and entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def index_existing_pdbs(folder: str) -> Dict[str, int]:
+    """
+    Count the ranked ColabFold PDBs of every input in a folder with one scan.
+
+    Args:
+        folder: Folder to scan
+
+    Returns:
+        Dict mapping input name to its number of ranked PDBs
+    """
+    index: Dict[str, int] = defaultdict(int)
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".pdb"):
+                    continue
+                for marker in ("_unrelaxed_rank_", "_relaxed_rank_"):
+                    name, found, _ = entry.name.partition(marker)
+                    if found:
+                        if entry.is_file():
+                            index[name] += 1
+                        break
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def get_prediction_status(fasta_name: str, output_folder: str, num_models: int,
+                          pdb_index: Optional[Dict[str, int]] = None) -> str:
     """
     Check prediction status for a FASTA file.
 
@@ -55,31 +138,311 @@ def get_prediction_status(fasta_name: str, output_folder: str, num_models: int)
         fasta_name: FASTA filename (without extension)
         output_folder: Output folder containing predictions
         num_models: Expected number of models
+        pdb_index: Index from index_existing_pdbs() of output_folder, to
+            avoid scanning the folder
 
     Returns:
         'completed': All expected PDBs exist
         'partial': Some but not all PDBs exist
         'not_started': No predictions found
     """
-    if not os.path.exists(output_folder):
-        return 'not_started'
-
-    # ColabFold output naming: {name}_unrelaxed_rank_{rank}_model_{model}.pdb
-    # or: {name}_relaxed_rank_{rank}_model_{model}.pdb
-    pattern = os.path.join(output_folder, f"{fasta_name}*_rank_*.pdb")
-    pdb_files = glob.glob(pattern)
+    if pdb_index is not None:
+        pdb_count = pdb_index.get(fasta_name, 0)
+    else:
+        pdb_count = len(list_rank_pdbs(output_folder, fasta_name))
 
-    if len(pdb_files) == 0:
+    if pdb_count == 0:
         return 'not_started'
-    elif len(pdb_files) >= num_models:
+    elif pdb_count >= num_models:
         return 'completed'
     else:
         return 'partial'
 
 
+def build_colabfold_command(input_path: str, output_folder: str, num_models: int = 5,
+                            use_gpu: bool = True, amber_relax: bool = False,
+                            msa_mode: Optional[str] = "mmseqs2_uniref_env",
+                            max_seq: Optional[int] = None, max_extra_seq: Optional[int] = None) -> List[str]:
+    """
+    Build a colabfold_batch command line.
+
+    Args:
+        input_path: FASTA/A3M file, or a directory of them
+        output_folder: Output folder for predictions
+        num_models: Number of models to predict
+        use_gpu: Use GPU acceleration
+        amber_relax: Apply AMBER relaxation
+        msa_mode: MSA generation mode, None to omit it (A3M inputs)
+        max_seq: Number of MSA cluster centers, None for ColabFold's default
+        max_extra_seq: Number of extra MSA sequences, None for ColabFold's default
+
+    Returns:
+        Command as list
+    """
+    # ColabFold is installed via pip in system Python
+    cmd = [
+        "colabfold_batch",
+        input_path,
+        output_folder,
+        "--num-models", str(num_models),
+        "--model-type", "alphafold2_multimer_v3",
+    ]
+    if msa_mode is not None:
+        cmd.extend(["--msa-mode", msa_mode])
+    if not use_gpu:
+        cmd.append("--cpu")
+    if amber_relax:
+        cmd.append("--amber")
+    if max_seq is not None:
+        cmd.extend(["--max-seq", str(max_seq)])
+    if max_extra_seq is not None:
+        cmd.extend(["--max-extra-seq", str(max_extra_seq)])
+    return cmd
+
+
+def run_colabfold_command(cmd: List[str], timeout: int, gpu_id: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Run a colabfold_batch command, streaming its output to stdout.
+
+    Args:
+        cmd: Command as list
+        timeout: Timeout in seconds
+        gpu_id: CUDA device to run on, None to keep this process's devices
+
+    Returns:
+        Tuple of (success, message)
+    """
+    # Stream the (long) ColabFold log live, keeping only its tail for errors
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    timed_out = threading.Event()
+
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            env=None if gpu_id is None else {**os.environ, "CUDA_VISIBLE_DEVICES": gpu_id}
+        )
+    except FileNotFoundError:
+        return False, "colabfold_batch not found in PATH"
+    except Exception as e:
+        return False, f"Exception: {str(e)}"
+
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        for line in proc.stdout:
+            print(line, end="", flush=True)
+            tail.append(line)
+        returncode = proc.wait()
+    except Exception as e:
+        proc.kill()
+        proc.wait()
+        return False, f"Exception: {str(e)}"
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+
+    if timed_out.is_set():
+        return False, f"Timeout (exceeded {format_hours(timeout)})"
+    if returncode == 0:
+        return True, "Success"
+    error_msg = "".join(tail)[-500:].strip() or "Unknown error"
+    return False, f"Failed: {error_msg}"
+
+
+@functools.cache
+def colabfold_available() -> bool:
+    """
+    Check whether ColabFold can be run in-process, without importing it.
+
+    Importing ColabFold loads JAX, which claims GPU memory, so this process
+    never imports it: in-process predictions run in a ColabFoldWorker.
+    """
+    return importlib.util.find_spec("colabfold") is not None
+
+
+@functools.cache
+def load_colabfold():
+    """
+    Import ColabFold for in-process predictions (in a ColabFoldWorker).
+
+    Returns:
+        The colabfold package, or None if it is not importable
+    """
+    try:
+        import colabfold.batch
+        import colabfold.download
+        import colabfold.utils
+    except ImportError:
+        return None
+    return colabfold
+
+
+def run_colabfold_in_process(input_path: str, output_folder: str, num_models: int = 5,
+                             use_gpu: bool = True, amber_relax: bool = False,
+                             msa_mode: Optional[str] = "mmseqs2_uniref_env",
+                             max_seq: Optional[int] = None, max_extra_seq: Optional[int] = None) -> Tuple[bool, str]:
+    """
+    Run ColabFold in this process, the equivalent of build_colabfold_command().
+
+    The JAX runtime and model weights stay loaded between calls, so no
+    interpreter startup or weight loading is paid per call. The call cannot
+    be interrupted: it is run through a ColabFoldWorker, which enforces the
+    timeout.
+
+    Args:
+        input_path: FASTA/A3M file, or a directory of them
+        output_folder: Output folder for predictions
+        num_models: Number of models to predict
+        use_gpu: Use GPU acceleration (for AMBER relaxation)
+        amber_relax: Apply AMBER relaxation
+        msa_mode: MSA generation mode, None to omit it (A3M inputs)
+        max_seq: Number of MSA cluster centers, None for ColabFold's default
+        max_extra_seq: Number of extra MSA sequences, None for ColabFold's default
+
+    Returns:
+        Tuple of (success, message)
+    """
+    colabfold = load_colabfold()
+    try:
+        colabfold.utils.setup_logging(Path(output_folder).joinpath("log.txt"))
+        queries, is_complex = colabfold.batch.get_queries(input_path)
+        model_type = colabfold.batch.set_model_type(is_complex, "alphafold2_multimer_v3")
+        colabfold.download.download_alphafold_params(model_type, Path(colabfold.download.default_data_dir))
+        msa_kwargs = {"msa_mode": msa_mode} if msa_mode is not None else {}
+        colabfold.batch.run(
+            queries=queries,
+            result_dir=output_folder,
+            num_models=num_models,
+            is_complex=is_complex,
+            model_type=model_type,
+            num_relax=num_models if amber_relax else 0,
+            use_gpu_relax=use_gpu,
+            user_agent="colabfold/combfold",
+            max_seq=max_seq,
+            max_extra_seq=max_extra_seq,
+            **msa_kwargs
+        )
+    except Exception as e:
+        return False, f"Exception: {str(e)}"
+    return True, "Success"
+
+
+def _colabfold_worker_main(conn, gpu_id: Optional[str]):
+    """Run the run_colabfold_in_process() calls received on conn until None is sent."""
+    if gpu_id is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = gpu_id
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            break
+        if args is None:
+            break
+        conn.send(run_colabfold_in_process(*args))
+
+
+class ColabFoldWorker:
+    """
+    A child process running ColabFold in-process, optionally pinned to one GPU.
+
+    JAX and the model weights stay loaded in the child between runs, while
+    the parent keeps the prediction timeout. A run that times out, crashes
+    the child or fails (e.g. out of GPU memory, which can leave JAX unusable)
+    stops the child; the next run starts a fresh one.
+    """
+
+    def __init__(self, gpu_id: Optional[str] = None):
+        """
+        Args:
+            gpu_id: CUDA device of the child, None to keep this process's devices
+        """
+        self.gpu_id = gpu_id
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        mp_context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = mp_context.Pipe()
+        self._process = mp_context.Process(target=_colabfold_worker_main,
+                                           args=(child_conn, self.gpu_id), daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def run(self, timeout: int, *args) -> Tuple[bool, str]:
+        """
+        Call run_colabfold_in_process(*args) in the child.
+
+        Args:
+            timeout: Timeout in seconds
+            *args: Arguments of run_colabfold_in_process()
+
+        Returns:
+            Tuple of (success, message)
+        """
+        if self._process is None:
+            self._start()
+        self._conn.send(args)
+
+        ready = multiprocessing.connection.wait([self._conn, self._process.sentinel], timeout)
+        if self._conn in ready:
+            try:
+                success, message = self._conn.recv()
+            except EOFError:
+                pass
+            else:
+                if not success:
+                    self.stop()
+                return success, message
+
+        if not ready:
+            message = f"Timeout (exceeded {format_hours(timeout)})"
+        else:
+            self._process.join(WORKER_STOP_TIMEOUT)
+            message = f"ColabFold worker exited (code {self._process.exitcode})"
+        self.stop(kill=True)
+        return False, message
+
+    def stop(self, kill: bool = False):
+        """
+        Stop the child process, if running.
+
+        Args:
+            kill: Kill it right away instead of letting it exit
+        """
+        if self._process is None:
+            return
+        if not kill and self._process.is_alive():
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+            self._process.join(WORKER_STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+
+def format_hours(seconds: int) -> str:
+    """Format a timeout in seconds as hours."""
+    hours = seconds / 3600
+    return f"{hours:g} hour" + ("" if hours == 1 else "s")
+
+
 def run_colabfold(fasta_path: str, output_folder: str, num_models: int = 5,
                   use_gpu: bool = True, amber_relax: bool = False,
-                  msa_mode: str = "mmseqs2_uniref_env") -> Tuple[bool, str]:
+                  msa_mode: Optional[str] = "mmseqs2_uniref_env",
+                  worker: Optional[ColabFoldWorker] = None) -> Tuple[bool, str]:
     """
     Run ColabFold batch on a single FASTA file.
 
@@ -93,11 +456,13 @@ def run_colabfold(fasta_path: str, output_folder: str, num_models: int = 5,
             - 'mmseqs2_uniref_env': Use ColabFold server (requires internet)
             - 'single_sequence': No MSA, use input sequence only (offline, less accurate)
             - 'mmseqs2_uniref': Use local MMseqs2 with UniRef30 database
+            - None: Omit the flag, for A3M inputs that already contain the MSA
+        worker: Worker to run ColabFold in-process in, None to run colabfold_batch
 
     Returns:
         Tuple of (success, message)
     """
-    fasta_name = Path(fasta_path).stem
+    fasta_name = os.path.splitext(os.path.basename(fasta_path))[0]
 
     # Check if already completed
     status = get_prediction_status(fasta_name, output_folder, num_models)
@@ -106,48 +471,77 @@ def run_colabfold(fasta_path: str, output_folder: str, num_models: int = 5,
 
     os.makedirs(output_folder, exist_ok=True)
 
-    # Build command - ColabFold is installed via pip in system Python
-    cmd = [
-        "colabfold_batch",
-        fasta_path,
-        output_folder,
-        "--num-models", str(num_models),
-        "--model-type", "alphafold2_multimer_v3",
-        "--msa-mode", msa_mode,
-    ]
-    if not use_gpu:
-        cmd.append("--cpu")
-    if amber_relax:
-        cmd.append("--amber")
+    if worker is not None:
+        print(f"      ColabFold (in-process): {fasta_path} {output_folder} ...", flush=True)
+        return worker.run(PREDICTION_TIMEOUT, fasta_path, output_folder, num_models,
+                          use_gpu, amber_relax, msa_mode)
+
+    cmd = build_colabfold_command(fasta_path, output_folder, num_models,
+                                  use_gpu, amber_relax, msa_mode)
 
     print(f"      Command: colabfold_batch {fasta_path} {output_folder} ...", flush=True)
 
+    return run_colabfold_command(cmd, PREDICTION_TIMEOUT)
+
+
+def run_colabfold_batch_dir(input_paths: List[str], output_folder: str, num_models: int = 5,
+                            use_gpu: bool = True, amber_relax: bool = False,
+                            msa_mode: Optional[str] = "mmseqs2_uniref_env",
+                            max_seq: Optional[int] = None, max_extra_seq: Optional[int] = None,
+                            worker: Optional[ColabFoldWorker] = None,
+                            gpu_id: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Run ColabFold batch once on several FASTA/A3M files.
+
+    The inputs are symlinked into a temporary staging directory which is
+    passed to a single colabfold_batch call, so model weights are loaded and
+    JAX functions are compiled once for the whole batch instead of per file.
+
+    Args:
+        input_paths: Paths to FASTA/A3M files
+        output_folder: Output folder for predictions
+        num_models: Number of models to predict
+        use_gpu: Use GPU acceleration
+        amber_relax: Apply AMBER relaxation
+        msa_mode: MSA generation mode, None to omit it (A3M inputs)
+        max_seq: Number of MSA cluster centers, None for ColabFold's default
+        max_extra_seq: Number of extra MSA sequences, None for ColabFold's default
+        worker: Worker to run ColabFold in-process in, None to run colabfold_batch
+        gpu_id: CUDA device for colabfold_batch, None to keep this process's
+            devices (a worker is pinned to its own device)
+
+    Returns:
+        Tuple of (success, message)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix="_colabfold_input_", dir=os.path.dirname(os.path.abspath(output_folder)))
+
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=7200  # 2 hour timeout per prediction
-        )
+        for input_path in input_paths:
+            os.symlink(os.path.abspath(input_path), os.path.join(staging_dir, os.path.basename(input_path)))
 
-        if result.returncode == 0:
-            return True, "Success"
-        else:
-            error_msg = result.stderr[:500] if result.stderr else "Unknown error"
-            return False, f"Failed: {error_msg}"
+        if worker is not None:
+            print(f"      ColabFold (in-process): <{len(input_paths)} input(s)> {output_folder} ...", flush=True)
+            return worker.run(PREDICTION_TIMEOUT * len(input_paths), staging_dir, output_folder, num_models,
+                              use_gpu, amber_relax, msa_mode, max_seq, max_extra_seq)
 
-    except subprocess.TimeoutExpired:
-        return False, "Timeout (exceeded 2 hours)"
-    except FileNotFoundError:
-        return False, "colabfold_batch not found in PATH"
-    except Exception as e:
-        return False, f"Exception: {str(e)}"
+        cmd = build_colabfold_command(staging_dir, output_folder, num_models,
+                                      use_gpu, amber_relax, msa_mode, max_seq, max_extra_seq)
+
+        print(f"      Command: colabfold_batch <{len(input_paths)} input(s)> {output_folder} ...", flush=True)
+
+        return run_colabfold_command(cmd, PREDICTION_TIMEOUT * len(input_paths), gpu_id)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
 
 def copy_pdbs_to_output(colabfold_output: str, pdbs_folder: str, fasta_name: str) -> int:
     """
     Copy relevant PDB files from ColabFold output to pdbs folder.
 
+    Files are moved with a single rename when possible (copied across
+    filesystems), so the pdbs folder holds every finished prediction.
+
     ColabFold creates output in: {output_folder}/{fasta_name}/
     We copy PDBs to: {pdbs_folder}/{fasta_name}_*.pdb
 
@@ -157,26 +551,276 @@ def copy_pdbs_to_output(colabfold_output: str, pdbs_folder: str, fasta_name: str
         fasta_name: Base name of the FASTA file
 
     Returns:
-        Number of PDB files copied
+        Number of PDB files copied (or moved)
     """
-    # ColabFold may put results in a subdirectory
-    search_paths = [
-        os.path.join(colabfold_output, "*.pdb"),
-        os.path.join(colabfold_output, fasta_name, "*.pdb"),
-    ]
+    # Results of other inputs of the same batch share the output folder, so
+    # match this input's name. ColabFold may also put results in a subdirectory.
+    pdb_paths = [os.path.join(colabfold_output, pdb_name)
+                 for pdb_name in list_rank_pdbs(colabfold_output, fasta_name)]
+    subdir = os.path.join(colabfold_output, fasta_name)
+    if os.path.isdir(subdir):
+        with os.scandir(subdir) as entries:
+            pdb_paths.extend(entry.path for entry in entries if entry.name.endswith(".pdb"))
+
+    # Deduplicate by target name, both locations may hold the same PDB
+    targets = {os.path.join(pdbs_folder, os.path.basename(pdb_path)): pdb_path for pdb_path in pdb_paths}
+    if not targets:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=min(8, len(targets))) as executor:
+        return sum(executor.map(move_or_copy, targets.values(), targets.keys()))
+
+
+def move_or_copy(src_path: str, dest_path: str) -> bool:
+    """
+    Move a file, or copy it if it is on another filesystem.
+
+    Args:
+        src_path: Existing file
+        dest_path: Path to create
+
+    Returns:
+        True if dest_path was created, False if it already existed
+    """
+    if os.path.exists(dest_path):
+        return False
+    try:
+        os.rename(src_path, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        return link_or_copy(src_path, dest_path)
+    return True
+
+
+def colabfold_output_dirs(temp_output: str) -> List[str]:
+    """List the ColabFold output folder and its per-GPU output folders."""
+    output_dirs = [temp_output]
+    with os.scandir(temp_output) as entries:
+        output_dirs.extend(entry.path for entry in entries if entry.name.startswith("gpu") and entry.is_dir())
+    return output_dirs
+
+
+def recover_predictions(temp_output: str, pdbs_folder: str, input_names: List[str], num_models: int) -> int:
+    """
+    Move predictions finished by an interrupted run into the pdbs folder.
+
+    Args:
+        temp_output: ColabFold output folder of the previous run
+        pdbs_folder: Target pdbs folder
+        input_names: Names of the inputs to recover
+        num_models: Expected number of models
+
+    Returns:
+        Number of inputs recovered
+    """
+    wanted = set(input_names)
+    recovered = 0
+    for output_dir in colabfold_output_dirs(temp_output):
+        for name, pdb_count in index_existing_pdbs(output_dir).items():
+            if name in wanted and pdb_count >= num_models and \
+                    copy_pdbs_to_output(output_dir, pdbs_folder, name) > 0:
+                recovered += 1
+    return recovered
+
+
+def link_or_copy(src_path: str, dest_path: str) -> bool:
+    """
+    Hardlink a file, or copy it if linking is not possible (e.g. cross-device).
+
+    Args:
+        src_path: Existing file
+        dest_path: Path to create
 
-    copied = 0
-    for pattern in search_paths:
-        for pdb_path in glob.glob(pattern):
-            pdb_name = os.path.basename(pdb_path)
-            dest_path = os.path.join(pdbs_folder, pdb_name)
+    Returns:
+        True if dest_path was created, False if it already existed
+    """
+    try:
+        _fast_copy(src_path, dest_path)
+    except FileExistsError:
+        return False
+    return True
+
+
+def _fast_copy(src_path: str, dest_path: str):
+    """
+    Copy a file without moving its bytes through Python where possible.
+
+    Tries a hardlink, then os.copy_file_range (a reflink on copy-on-write
+    filesystems, an in-kernel copy otherwise), then shutil.copyfile (which
+    uses sendfile on Linux). Metadata is copied as shutil.copy2 does.
+
+    Raises:
+        FileExistsError: If dest_path already exists
+    """
+    try:
+        os.link(src_path, dest_path)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.path.exists(dest_path):
+            raise FileExistsError(dest_path)
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dest.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                shutil.copystat(src_path, dest_path)
+                return
+        except OSError:
+            pass
+
+    shutil.copyfile(src_path, dest_path)
+    shutil.copystat(src_path, dest_path)
+
+
+def sequence_hash(input_path: str) -> str:
+    """
+    Hash the sequence content of a FASTA/A3M file.
+
+    FASTA headers are ignored, sequences are uppercased and chains are sorted,
+    so inputs with the same chains in any order and under any name hash the
+    same. A3M files are hashed as-is, since the MSA is part of the input.
+
+    Args:
+        input_path: Path to FASTA or A3M file
+
+    Returns:
+        Hex digest of the canonical content
+    """
+    with open(input_path, "rb") as f:
+        content = f.read()
+
+    if input_path.endswith(".a3m"):
+        return hashlib.blake2b(b"a3m:" + content).hexdigest()
+
+    records = [[]]
+    for line in content.decode().splitlines():
+        if line.startswith(">"):
+            records.append([])
+        else:
+            records[-1].append(line.strip())
+    chains = [chain for record in records for chain in "".join(record).upper().split(":") if chain]
+    return hashlib.blake2b(":".join(sorted(chains)).encode()).hexdigest()
+
+
+def _load_cache(pdbs_folder: str) -> Dict[str, dict]:
+    """
+    Load the prediction cache of a pdbs folder.
 
-            # Only copy if not already there
-            if not os.path.exists(dest_path):
-                shutil.copy2(pdb_path, dest_path)
-                copied += 1
+    The cache maps a sequence hash to {"num_models": N, "names": [...]}, the
+    input names whose N ranked PDBs are in the pdbs folder. It is only
+    trusted without scanning the folder while _cache_is_current().
 
-    return copied
+    Args:
+        pdbs_folder: Folder containing the predictions
+
+    Returns:
+        The cache, empty if missing or unreadable
+    """
+    try:
+        with open(os.path.join(pdbs_folder, CACHE_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_cache(pdbs_folder: str, cache: Dict[str, dict]):
+    """
+    Atomically save the prediction cache of a pdbs folder.
+
+    The cache file gets the folder's mtime, which changes whenever a file is
+    added to or removed from the folder (see _cache_is_current()).
+    """
+    cache_path = os.path.join(pdbs_folder, CACHE_FILE)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    folder_mtime = os.stat(pdbs_folder).st_mtime_ns
+    os.utime(cache_path, ns=(folder_mtime, folder_mtime))
+
+
+def _cache_is_current(pdbs_folder: str) -> bool:
+    """Check that no file was added to or removed from a pdbs folder since its cache was saved."""
+    try:
+        return os.stat(os.path.join(pdbs_folder, CACHE_FILE)).st_mtime_ns == os.stat(pdbs_folder).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def _prune_cache(cache: Dict[str, dict], pdb_index: Dict[str, int]):
+    """Drop the cached names whose ranked PDBs are no longer all in the pdbs folder."""
+    for input_hash, entry in list(cache.items()):
+        entry["names"] = [name for name in entry["names"] if pdb_index.get(name, 0) >= entry["num_models"]]
+        if not entry["names"]:
+            del cache[input_hash]
+
+
+def _record_prediction(cache: Dict[str, dict], input_hash: str, input_name: str, pdb_count: int):
+    """Record in the cache that input_name has pdb_count ranked PDBs."""
+    entry = cache.get(input_hash)
+    if entry is None or entry["num_models"] < pdb_count:
+        cache[input_hash] = {"num_models": pdb_count, "names": [input_name]}
+    elif input_name not in entry["names"] and pdb_count >= entry["num_models"]:
+        entry["names"].append(input_name)
+
+
+def clone_pdbs(src_name: str, dst_name: str, pdbs_folder: str) -> int:
+    """
+    Reuse the predictions of one input for another input with the same sequences.
+
+    {src_name}_*rank_*.pdb files are hardlinked (or copied, if linking is not
+    possible) to {dst_name}_*rank_*.pdb.
+
+    Args:
+        src_name: Name of the already predicted input
+        dst_name: Name of the duplicate input
+        pdbs_folder: Folder containing the predictions
+
+    Returns:
+        Number of PDB files cloned
+    """
+    cloned = 0
+    for src_pdb in list_rank_pdbs(pdbs_folder, src_name):
+        src_path = os.path.join(pdbs_folder, src_pdb)
+        dst_path = os.path.join(pdbs_folder, dst_name + src_pdb[len(src_name):])
+        cloned += link_or_copy(src_path, dst_path)
+    return cloned
+
+
+def _seq_length(input_path: str) -> int:
+    """
+    Get the number of residues of the query in a FASTA/A3M file.
+
+    Only the first record is read (the query, for A3M files), with chains
+    separated by ':' as colabfold_batch expects.
+
+    Args:
+        input_path: Path to FASTA or A3M file
+
+    Returns:
+        Total query length over all chains
+    """
+    length = 0
+    in_query = False
+    with open(input_path) as f:
+        for line in f:
+            if line.startswith(">"):
+                if in_query:
+                    break
+                in_query = True
+            elif in_query:
+                line = line.strip()
+                length += len(line) - line.count(":")
+    return length
 
 
 def find_input_files(input_folder: str, msa_mode: str) -> List[str]:
@@ -190,23 +834,155 @@ def find_input_files(input_folder: str, msa_mode: str) -> List[str]:
     Returns:
         List of input file paths
     """
+    fasta_files, a3m_files, subdirs = [], [], []
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.name.endswith(".fasta"):
+                fasta_files.append(entry.path)
+            elif entry.name.endswith(".a3m"):
+                a3m_files.append(entry.path)
+            elif entry.is_dir():
+                subdirs.append(entry.path)
+
     if msa_mode == "local":
-        # Local mode uses pre-computed A3M files
-        a3m_files = sorted(glob.glob(os.path.join(input_folder, "*.a3m")))
+        # Local mode uses pre-computed A3M files only. FASTA inputs are never
+        # used as a fallback: without --msa-mode, colabfold_batch would send
+        # them to the MSA server.
         if a3m_files:
-            return a3m_files
+            return sorted(a3m_files)
         # Also check subdirectories (colabfold_search output structure)
-        a3m_files = sorted(glob.glob(os.path.join(input_folder, "*", "*.a3m")))
-        if a3m_files:
-            return a3m_files
+        for subdir in subdirs:
+            with os.scandir(subdir) as entries:
+                a3m_files.extend(entry.path for entry in entries
+                                 if entry.name.endswith(".a3m") and not entry.name.startswith("."))
+        if not a3m_files and fasta_files:
+            print(f"   WARNING: {len(fasta_files)} FASTA file(s) but no A3M files in {input_folder}; "
+                  f"run run_msa_search.py first", flush=True)
+        return sorted(a3m_files)
 
     # Default: FASTA files
-    return sorted(glob.glob(os.path.join(input_folder, "*.fasta")))
+    return sorted(fasta_files)
+
+
+def bucket_by_length(inputs: List[Tuple[str, str]], lengths: Dict[str, int],
+                     edges: Tuple[int, ...] = LENGTH_BUCKET_EDGES) -> Dict[int, List[Tuple[str, str]]]:
+    """
+    Partition inputs into query length buckets.
+
+    Args:
+        inputs: (input_path, input_name) pairs
+        lengths: Query length of each input path
+        edges: Increasing bucket upper bounds; longer inputs go to a last bucket
+
+    Returns:
+        Dict mapping a bucket's lower bound (exclusive) to its inputs, for
+        bounds 0, edges[0], ..., edges[-1]
+    """
+    buckets: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+    for input_path, input_name in inputs:
+        lower = 0
+        for edge in edges:
+            if lengths[input_path] <= edge:
+                break
+            lower = edge
+        buckets[lower].append((input_path, input_name))
+    return buckets
+
+
+def select_gpus(num_gpus: int) -> List[Optional[str]]:
+    """
+    Choose the CUDA devices of the prediction workers.
+
+    Devices are taken from this process's CUDA_VISIBLE_DEVICES (all devices
+    when it is unset), and num_gpus is capped at the number listed there.
+
+    Args:
+        num_gpus: Number of GPUs to predict on
+
+    Returns:
+        CUDA device per worker, or [None] for a single worker that keeps
+        this process's devices
+    """
+    if num_gpus <= 1:
+        return [None]
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is None:
+        return [str(i) for i in range(num_gpus)]
+    devices = [device.strip() for device in visible.split(",") if device.strip()]
+    if len(devices) < num_gpus:
+        print(f"   WARNING: --num-gpus {num_gpus} but CUDA_VISIBLE_DEVICES={visible}, "
+              f"using {max(len(devices), 1)} GPU(s)", flush=True)
+    if len(devices) <= 1:
+        return [None]
+    return devices[:num_gpus]
+
+
+def predict_in_shards(pending: List[Tuple[str, str]], temp_output: str,
+                      gpu_ids: List[Optional[str]], num_models: int = 5, use_gpu: bool = True,
+                      amber_relax: bool = False, msa_mode: Optional[str] = "mmseqs2_uniref_env",
+                      max_seq: Optional[int] = None, max_extra_seq: Optional[int] = None,
+                      workers: Optional[List[ColabFoldWorker]] = None
+                      ) -> Iterator[Tuple[List[Tuple[str, str]], str, bool, str]]:
+    """
+    Predict inputs with one ColabFold batch per GPU, running concurrently.
+
+    Inputs are dealt round-robin to one shard per GPU (longest-first inputs
+    spread evenly). Shard i is predicted on gpu_ids[i], in workers[i] (pinned
+    to that GPU) or as a colabfold_batch subprocess, into temp_output/gpu{i};
+    with a single GPU, into temp_output. ColabFold is never loaded in this
+    process.
+
+    Args:
+        pending: (input_path, input_name) pairs to predict
+        temp_output: ColabFold output folder
+        gpu_ids: CUDA device per shard, [None] to keep this process's devices
+        num_models: Number of models to predict
+        use_gpu: Use GPU acceleration
+        amber_relax: Apply AMBER relaxation
+        msa_mode: MSA generation mode, None to omit it (A3M inputs)
+        max_seq: Number of MSA cluster centers, None for ColabFold's default
+        max_extra_seq: Number of extra MSA sequences, None for ColabFold's default
+        workers: Worker per GPU to run ColabFold in-process in, None to run
+            colabfold_batch
+
+    Yields:
+        Tuples of (shard, shard_output, success, message) as shards finish
+    """
+    shards = [pending[i::len(gpu_ids)] for i in range(min(len(gpu_ids), len(pending)))]
+
+    def predict_shard(i: int) -> Tuple[bool, str]:
+        return run_colabfold_batch_dir(
+            [input_path for input_path, _ in shards[i]],
+            shard_outputs[i], num_models, use_gpu, amber_relax, msa_mode, max_seq, max_extra_seq,
+            workers[i] if workers else None, gpu_ids[i]
+        )
+
+    if len(gpu_ids) == 1:
+        shard_outputs = [temp_output]
+    else:
+        shard_outputs = [os.path.join(temp_output, f"gpu{i}") for i in range(len(shards))]
+
+    if len(shards) == 1:
+        success, message = predict_shard(0)
+        yield shards[0], shard_outputs[0], success, message
+        return
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        futures = {executor.submit(predict_shard, i): i for i in range(len(shards))}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                success, message = future.result()
+            except Exception as e:
+                success, message = False, f"Exception: {str(e)}"
+            yield shards[i], shard_outputs[i], success, message
 
 
 def process_all_fastas(input_folder: str, pdbs_folder: str, num_models: int = 5,
                        use_gpu: bool = True, amber_relax: bool = False,
-                       msa_mode: str = "mmseqs2_uniref_env") -> Tuple[int, int, int]:
+                       msa_mode: str = "mmseqs2_uniref_env", num_gpus: int = 1) -> Tuple[int, int, int]:
     """
     Process all FASTA/A3M files in a folder.
 
@@ -217,6 +993,7 @@ def process_all_fastas(input_folder: str, pdbs_folder: str, num_models: int = 5,
         use_gpu: Use GPU acceleration
         amber_relax: Apply AMBER relaxation
         msa_mode: MSA generation mode
+        num_gpus: Number of GPUs to predict on concurrently
 
     Returns:
         Tuple of (completed, failed, skipped)
@@ -232,46 +1009,148 @@ def process_all_fastas(input_folder: str, pdbs_folder: str, num_models: int = 5,
     file_type = "A3M" if msa_mode == "local" else "FASTA"
     print(f"   Found {len(input_files)} {file_type} file(s)", flush=True)
 
+    # Longest inputs first, so inputs of similar length (same padded JAX
+    # shapes) are processed together and the largest compile happens first.
+    # colabfold_batch also sorts the queries it is given (--sort-queries-by).
+    lengths = {input_path: _seq_length(input_path) for input_path in input_files}
+    input_files.sort(key=lambda path: (-lengths[path], path))
+
     completed = 0
     failed = 0
     skipped = 0
 
+    # Checked before the temporary output folder is created in the pdbs folder
+    cache_current = _cache_is_current(pdbs_folder)
+
     # Create temporary output folder for ColabFold
     temp_output = os.path.join(pdbs_folder, "_colabfold_output")
     os.makedirs(temp_output, exist_ok=True)
 
     # Determine effective MSA mode for colabfold_batch
-    # When using local A3M files, colabfold_batch doesn't need MSA mode flag
-    effective_msa_mode = msa_mode if msa_mode != "local" else "mmseqs2_uniref_env"
-
-    for i, input_path in enumerate(input_files, 1):
-        input_name = Path(input_path).stem
-        print(f"\n   [{i}/{len(input_files)}] Processing {input_name}...", flush=True)
+    # When using local A3M files, colabfold_batch reads the MSA from the input,
+    # so the MSA mode flag is omitted
+    effective_msa_mode = msa_mode if msa_mode != "local" else None
+
+    cache = _load_cache(pdbs_folder)
+    pending: List[Tuple[str, str]] = []  # (input_path, input_name)
+    pending_by_hash: Dict[str, str] = {}
+    duplicates: List[Tuple[str, str]] = []  # (input_name, predicted input_name)
+    input_hashes: Dict[str, str] = {}
+    input_names = [os.path.splitext(os.path.basename(input_path))[0] for input_path in input_files]
+
+    # Resume from predictions finished before an interruption
+    recovered = recover_predictions(temp_output, pdbs_folder, input_names, num_models)
+    if recovered:
+        print(f"   Recovered {recovered} prediction(s) from a previous run", flush=True)
+
+    # Snapshot existing predictions once (right away if files were added to or
+    # removed from the pdbs folder since the cache was saved, e.g. PDBs deleted
+    # to be rerun, otherwise only if the cache is not enough), then keep the
+    # index up to date
+    pdb_index: Optional[Dict[str, int]] = None
+    if not cache_current:
+        pdb_index = index_existing_pdbs(pdbs_folder)
+        _prune_cache(cache, pdb_index)
+
+    for i, (input_path, input_name) in enumerate(zip(input_files, input_names), 1):
+        input_hash = input_hashes[input_name] = sequence_hash(input_path)
+        entry = cache.get(input_hash)
+        cached = entry is not None and entry["num_models"] >= num_models
 
         # Check if already processed
-        status = get_prediction_status(input_name, pdbs_folder, num_models)
+        if cached and input_name in entry["names"]:
+            print(f"   [{i}/{len(input_files)}] Skipping {input_name} (already completed)", flush=True)
+            skipped += 1
+            continue
+
+        if pdb_index is None:
+            pdb_index = index_existing_pdbs(pdbs_folder)
+        status = get_prediction_status(input_name, pdbs_folder, num_models, pdb_index)
         if status == 'completed':
-            print(f"      Skipping (already completed)", flush=True)
+            print(f"   [{i}/{len(input_files)}] Skipping {input_name} (already completed)", flush=True)
+            _record_prediction(cache, input_hash, input_name, pdb_index[input_name])
             skipped += 1
             continue
 
-        # Run prediction
-        success, message = run_colabfold(
-            input_path,
-            temp_output,
-            num_models,
-            use_gpu,
-            amber_relax,
-            effective_msa_mode
-        )
+        # Reuse predictions of an input with the same sequences
+        if cached:
+            src_name = entry["names"][0]
+            cloned = clone_pdbs(src_name, input_name, pdbs_folder)
+            if cloned > 0:
+                pdb_index[input_name] += cloned
+                _record_prediction(cache, input_hash, input_name, pdb_index[input_name])
+                print(f"   [{i}/{len(input_files)}] {input_name}: same sequences as {src_name}, "
+                      f"{cloned} PDB(s) reused", flush=True)
+                completed += 1
+                continue
+            # The cached PDBs are gone
+            del cache[input_hash]
+
+        if input_hash in pending_by_hash:
+            duplicates.append((input_name, pending_by_hash[input_hash]))
+            continue
 
-        if success:
-            # Copy PDBs to output folder
-            copied = copy_pdbs_to_output(temp_output, pdbs_folder, input_name)
-            print(f"      Completed: {copied} PDB(s) copied", flush=True)
+        pending_by_hash[input_hash] = input_name
+        pending.append((input_path, input_name))
+
+    if pending:
+        # Predict the pending inputs in one colabfold_batch run per length
+        # bucket and GPU, longest bucket first
+        print(f"\n   Predicting {len(pending)} input(s)...", flush=True)
+        done = 0
+        buckets = bucket_by_length(pending, lengths)
+        # ColabFold runs in-process in one worker process per GPU, which keeps
+        # JAX and the weights loaded across buckets while this process
+        # enforces the timeout
+        gpu_ids = select_gpus(num_gpus)
+        workers = [ColabFoldWorker(gpu_id) for gpu_id in gpu_ids] if colabfold_available() else None
+        try:
+            for lower in sorted(buckets, reverse=True):
+                bucket = buckets[lower]
+                upper = next((edge for edge in LENGTH_BUCKET_EDGES if edge > lower), None)
+                label = f"{lower + 1}-{upper}" if upper is not None else f">{lower}"
+                if lower >= LARGE_INPUT_LENGTH:
+                    max_seq, max_extra_seq = LARGE_INPUT_MAX_SEQ, LARGE_INPUT_MAX_EXTRA_SEQ
+                else:
+                    max_seq, max_extra_seq = None, None
+                print(f"\n   Length {label}: {len(bucket)} input(s)", flush=True)
+
+                bucket_completed = 0
+                for shard, shard_output, success, message in predict_in_shards(
+                        bucket, temp_output, gpu_ids, num_models, use_gpu, amber_relax, effective_msa_mode,
+                        max_seq, max_extra_seq, workers):
+                    if not success:
+                        print(f"      colabfold_batch: {message}", flush=True)
+
+                    for input_path, input_name in shard:
+                        done += 1
+                        # Copy PDBs to output folder
+                        copied = copy_pdbs_to_output(shard_output, pdbs_folder, input_name)
+                        pdb_index[input_name] += copied
+                        status = get_prediction_status(input_name, pdbs_folder, num_models, pdb_index)
+                        if status == 'completed' or (success and copied > 0):
+                            print(f"   [{done}/{len(pending)}] {input_name}: {copied} PDB(s) copied", flush=True)
+                            _record_prediction(cache, input_hashes[input_name], input_name, pdb_index[input_name])
+                            bucket_completed += 1
+                        else:
+                            print(f"   [{done}/{len(pending)}] {input_name}: Failed ({status})", flush=True)
+                            failed += 1
+
+                completed += bucket_completed
+                print(f"   Length {label}: {bucket_completed}/{len(bucket)} completed", flush=True)
+        finally:
+            for worker in workers or []:
+                worker.stop()
+
+    for input_name, src_name in duplicates:
+        if get_prediction_status(src_name, pdbs_folder, num_models, pdb_index) == 'completed':
+            cloned = clone_pdbs(src_name, input_name, pdbs_folder)
+            pdb_index[input_name] += cloned
+            _record_prediction(cache, input_hashes[input_name], input_name, pdb_index[input_name])
+            print(f"   {input_name}: same sequences as {src_name}, {cloned} PDB(s) reused", flush=True)
             completed += 1
         else:
-            print(f"      Failed: {message}", flush=True)
+            print(f"   {input_name}: Failed (same sequences as failed {src_name})", flush=True)
             failed += 1
 
     # Cleanup temp folder (but keep if there were failures for debugging)
@@ -281,6 +1160,9 @@ def process_all_fastas(input_folder: str, pdbs_folder: str, num_models: int = 5,
         except Exception:
             pass
 
+    # Saved last, so the cache stays current until the pdbs folder changes
+    _save_cache(pdbs_folder, cache)
+
     return completed, failed, skipped
 
 
@@ -309,6 +1191,10 @@ def parse_args():
         "--amber", action="store_true",
         help="Apply AMBER relaxation to predictions"
     )
+    parser.add_argument(
+        "--num-gpus", type=int, default=1,
+        help="Number of GPUs to predict on concurrently (default: 1)"
+    )
     parser.add_argument(
         "--msa-mode", type=str, default="mmseqs2_uniref_env",
         choices=["mmseqs2_uniref_env", "single_sequence", "mmseqs2_uniref", "local"],
@@ -333,6 +1219,8 @@ def main():
     print(f"   MSA Mode: {args.msa_mode}", flush=True)
     print(f"   Docker:   {is_inside_docker()}", flush=True)
     print(f"   GPU:      {not args.cpu}", flush=True)
+    if args.num_gpus > 1:
+        print(f"   GPUs:     {args.num_gpus}", flush=True)
 
     if args.msa_mode == "single_sequence":
         print(f"\n   WARNING: Using single_sequence mode (no MSA).", flush=True)
@@ -353,7 +1241,8 @@ def main():
         args.num_models,
         use_gpu=not args.cpu,
         amber_relax=args.amber,
-        msa_mode=args.msa_mode
+        msa_mode=args.msa_mode,
+        num_gpus=args.num_gpus
     )
 
     print(f"\n{'='*60}", flush=True)
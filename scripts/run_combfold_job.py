@@ -13,20 +13,36 @@ Usage:
 """
 
 import argparse
-import json
 import os
 import subprocess
 import sys
 import time
+from collections import deque
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 
 # Add the scripts directory to path for imports
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, SCRIPT_DIR)
 
-from excel_to_subunits import row_to_subunits, sequences_list_to_dict
-from split_large_subunits import split_subunits_for_af_size, needs_splitting
+from excel_to_subunits import row_to_subunits, sequences_list_to_dict, write_json
+from run_afm_predictions import index_existing_pdbs
+from split_large_subunits import maybe_split_subunits_for_af_size
+
+# Lines of subprocess output kept for failure triage
+OUTPUT_TAIL_LINES = 50
+
+# Wait before retrying a command that failed on a locked database
+DB_LOCKED_BACKOFF = 30
+
+# SQLite lock errors (SQLITE_BUSY / SQLITE_LOCKED)
+DB_LOCKED_PATTERNS = ("database is locked", "database table is locked")
+# XLA and CUDA out-of-GPU-memory markers
+OOM_PATTERNS = ("RESOURCE_EXHAUSTED", "CUDA_ERROR_OUT_OF_MEMORY")
+
+# classifier(cmd, output_tail) -> (retry_cmd, delay_seconds, reason), or None
+# if the failure is not recoverable
+Classifier = Callable[[List[str], str], Optional[Tuple[List[str], int, str]]]
 
 
 def parse_args():
@@ -54,6 +70,10 @@ def parse_args():
         "--skip_afm", action="store_true",
         help="Skip AlphaFold-Multimer predictions (use existing PDBs)"
     )
+    parser.add_argument(
+        "--skip_assembly", action="store_true",
+        help="Stop after the AFM predictions (assemble later with --skip_afm)"
+    )
     parser.add_argument(
         "--max_af_size", type=int, default=1800,
         help="Max combined sequence length for AFM (default: 1800)"
@@ -66,9 +86,125 @@ def parse_args():
         "--msa_mode", type=str, default="mmseqs2_uniref_env",
         help="MSA generation mode: mmseqs2_uniref_env (default), single_sequence (offline), mmseqs2_uniref (local db)"
     )
+    parser.add_argument(
+        "--msa_cache_dir", type=str, default=None,
+        help="MSA cache folder shared by jobs (local MSA mode)"
+    )
     return parser.parse_args()
 
 
+def count_files(directory: str, suffix: str) -> int:
+    """
+    Count the files in a directory with the given suffix.
+
+    Uses os.scandir(), which gets the names from one directory read.
+
+    Args:
+        directory: Directory to scan
+        suffix: Filename suffix (e.g. '.pdb')
+
+    Returns:
+        Number of matching entries (0 for a missing directory)
+    """
+    try:
+        with os.scandir(directory) as it:
+            return sum(1 for entry in it if entry.name.endswith(suffix))
+    except (FileNotFoundError, NotADirectoryError):
+        return 0
+
+
+def run_command(cmd: List[str]) -> Tuple[int, str]:
+    """
+    Run a command, streaming its output to stdout.
+
+    Args:
+        cmd: Command line
+
+    Returns:
+        Tuple of (returncode, last lines of combined stdout/stderr)
+    """
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, errors="replace", bufsize=1) as proc:
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            tail.append(line)
+        sys.stdout.flush()
+    return proc.returncode, "".join(tail)
+
+
+def classify_transient(cmd: List[str], output: str) -> Optional[Tuple[List[str], int, str]]:
+    """
+    Classify a failure as a locked database, retried unchanged after a backoff.
+
+    Args:
+        cmd: Command line that failed
+        output: Tail of its output
+
+    Returns:
+        (cmd, DB_LOCKED_BACKOFF, reason) for a locked database, else None
+    """
+    if any(pattern in output for pattern in DB_LOCKED_PATTERNS):
+        return cmd, DB_LOCKED_BACKOFF, "database locked"
+    return None
+
+
+def classify_afm_failure(cmd: List[str], output: str) -> Optional[Tuple[List[str], int, str]]:
+    """
+    Classify a run_afm_predictions.py failure.
+
+    Out-of-memory failures are retried with half the models. Completed
+    predictions are skipped on the rerun, so only the inputs left over get
+    fewer models; run_pipeline() lists them in the Stage 3b summary. Locked
+    databases are handled as in classify_transient().
+
+    Args:
+        cmd: Command line that failed
+        output: Tail of its output
+
+    Returns:
+        (retry_cmd, delay, reason) if the failure is recoverable, else None
+    """
+    if any(pattern in output for pattern in OOM_PATTERNS) and "--num-models" in cmd:
+        index = cmd.index("--num-models") + 1
+        num_models = int(cmd[index])
+        if num_models > 1:
+            retry_cmd = list(cmd)
+            retry_cmd[index] = str(num_models // 2)
+            return retry_cmd, 0, (f"out of memory, retrying the inputs not predicted yet "
+                                  f"with {num_models // 2} instead of {num_models} model(s)")
+    return classify_transient(cmd, output)
+
+
+def run_with_retry(cmd: List[str], classifier: Optional[Classifier] = classify_transient,
+                   retries: int = 1) -> bool:
+    """
+    Run a command and retry it when its failure is classified as recoverable.
+
+    Args:
+        cmd: Command line
+        classifier: Maps (cmd, output tail) of a failed run to
+            (retry_cmd, delay_seconds, reason), or None if not recoverable
+        retries: Maximum number of retries
+
+    Returns:
+        True if successful
+    """
+    for attempt in range(retries + 1):
+        returncode, output = run_command(cmd)
+        if returncode == 0:
+            return True
+        if attempt == retries or classifier is None:
+            break
+        retry = classifier(cmd, output)
+        if retry is None:
+            break
+        cmd, delay, reason = retry
+        print(f"   Command failed ({reason}); retrying in {delay}s...", flush=True)
+        time.sleep(delay)
+    return False
+
+
 def create_subunits_json(job_id: str, sequences: List[str], output_path: str,
                          max_af_size: int = 1800) -> dict:
     """
@@ -90,13 +226,12 @@ def create_subunits_json(job_id: str, sequences: List[str], output_path: str,
     subunits = row_to_subunits(job_id, seq_dict)
 
     # Split large sequences into domains if needed
-    if needs_splitting(subunits, max_af_size):
-        print(f"   Splitting large sequences (max_af_size={max_af_size})...", flush=True)
-        subunits = split_subunits_for_af_size(subunits, max_af_size, verbose=True)
+    subunits, _ = maybe_split_subunits_for_af_size(
+        subunits, max_af_size, verbose=True,
+        header=f"   Splitting large sequences (max_af_size={max_af_size})...")
 
-    # Save to file
-    with open(output_path, "w") as f:
-        json.dump(subunits, f, indent=2)
+    # Save to file (orjson when available)
+    write_json(output_path, subunits)
 
     return subunits
 
@@ -124,12 +259,11 @@ def run_prepare_fastas(subunits_json: str, fastas_folder: str, max_af_size: int)
     ]
 
     print(f"   Running: {' '.join(cmd)}", flush=True)
-    result = subprocess.run(cmd, capture_output=False)
-
-    return result.returncode == 0
+    return run_with_retry(cmd)
 
 
-def run_msa_search(fastas_folder: str, msas_folder: str, db_path: str = "/cache/colabfold_db") -> bool:
+def run_msa_search(fastas_folder: str, msas_folder: str, db_path: str = "/cache/colabfold_db",
+                   msa_cache_dir: Optional[str] = None) -> bool:
     """
     Run local MSA search using colabfold_search.
 
@@ -137,6 +271,7 @@ def run_msa_search(fastas_folder: str, msas_folder: str, db_path: str = "/cache/
         fastas_folder: Folder containing FASTA files
         msas_folder: Output folder for A3M files
         db_path: Path to MMseqs2 database
+        msa_cache_dir: MSA cache folder shared by jobs (None: no cache)
 
     Returns:
         True if successful
@@ -149,11 +284,11 @@ def run_msa_search(fastas_folder: str, msas_folder: str, db_path: str = "/cache/
         msas_folder,
         "--db", db_path
     ]
+    if msa_cache_dir:
+        cmd.extend(["--msa-cache-dir", msa_cache_dir])
 
     print(f"   Running: {' '.join(cmd[:4])} ...", flush=True)
-    result = subprocess.run(cmd, capture_output=False)
-
-    return result.returncode == 0
+    return run_with_retry(cmd)
 
 
 def run_afm_predictions(input_folder: str, pdbs_folder: str, num_models: int = 5,
@@ -181,9 +316,7 @@ def run_afm_predictions(input_folder: str, pdbs_folder: str, num_models: int = 5
     ]
 
     print(f"   Running: {' '.join(cmd)}", flush=True)
-    result = subprocess.run(cmd, capture_output=False)
-
-    return result.returncode == 0
+    return run_with_retry(cmd, classify_afm_failure)
 
 
 def run_assembly(subunits_json: str, pdbs_folder: str, output_folder: str) -> bool:
@@ -208,15 +341,15 @@ def run_assembly(subunits_json: str, pdbs_folder: str, output_folder: str) -> bo
     ]
 
     print(f"   Running: {' '.join(cmd)}", flush=True)
-    result = subprocess.run(cmd, capture_output=False)
-
-    return result.returncode == 0
+    return run_with_retry(cmd)
 
 
 def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
                  gpu_id: int, skip_afm: bool = False,
                  max_af_size: int = 1800, num_models: int = 5,
-                 msa_mode: str = "mmseqs2_uniref_env") -> bool:
+                 msa_mode: str = "mmseqs2_uniref_env",
+                 msa_cache_dir: Optional[str] = None,
+                 skip_assembly: bool = False) -> bool:
     """
     Run the complete CombFold pipeline for a single job.
 
@@ -229,6 +362,9 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
         max_af_size: Max sequence length for AFM
         num_models: Number of AFM models
         msa_mode: MSA generation mode
+        msa_cache_dir: MSA cache folder shared by jobs (local MSA mode)
+        skip_assembly: Stop after the AFM predictions, so that the GPU is free
+            while the assembly runs in another process
 
     Returns:
         True if successful
@@ -261,11 +397,12 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
     if not os.path.exists(subunits_json_path):
         try:
             subunits = create_subunits_json(job_id, sequences, subunits_json_path, max_af_size)
-            print(f"   Created {len(subunits)} subunit(s)", flush=True)
-            for name, info in subunits.items():
-                chains = ", ".join(info["chain_names"])
-                seq_len = len(info["sequence"])
-                print(f"   - {name}: chains=[{chains}], length={seq_len}", flush=True)
+            # One write for the whole summary, however many subunits there are
+            summary = "".join(
+                f"\n   - {name}: chains=[{', '.join(info['chain_names'])}], length={len(info['sequence'])}"
+                for name, info in subunits.items()
+            )
+            print(f"   Created {len(subunits)} subunit(s){summary}", flush=True)
         except Exception as e:
             print(f"   ERROR: Failed to create subunits.json: {e}", flush=True)
             return False
@@ -274,14 +411,14 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
 
     # Stage 2: Generate FASTAs
     print(f"\n[Stage 2] Generating FASTA files...", flush=True)
-    if not os.path.exists(fastas_folder) or not os.listdir(fastas_folder):
+    fasta_count = count_files(fastas_folder, ".fasta")
+    if fasta_count == 0:
         if not run_prepare_fastas(subunits_json_path, fastas_folder, max_af_size):
             print(f"   ERROR: Failed to generate FASTAs", flush=True)
             return False
-        fasta_count = len([f for f in os.listdir(fastas_folder) if f.endswith('.fasta')])
+        fasta_count = count_files(fastas_folder, ".fasta")
         print(f"   Generated {fasta_count} FASTA file(s)", flush=True)
     else:
-        fasta_count = len([f for f in os.listdir(fastas_folder) if f.endswith('.fasta')])
         print(f"   Using existing {fasta_count} FASTA file(s)", flush=True)
 
     # Stage 3a: MSA Search (only for local mode)
@@ -290,15 +427,15 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
         os.makedirs(msas_folder, exist_ok=True)
 
         # Check for existing A3M files
-        existing_a3ms = len([f for f in os.listdir(msas_folder) if f.endswith('.a3m')]) if os.path.exists(msas_folder) else 0
+        existing_a3ms = count_files(msas_folder, ".a3m")
         if existing_a3ms > 0:
             print(f"   Found {existing_a3ms} existing A3M(s), checking for completeness...", flush=True)
 
-        if not run_msa_search(fastas_folder, msas_folder):
+        if not run_msa_search(fastas_folder, msas_folder, msa_cache_dir=msa_cache_dir):
             print(f"   ERROR: Failed to run MSA search", flush=True)
             return False
 
-        a3m_count = len([f for f in os.listdir(msas_folder) if f.endswith('.a3m')])
+        a3m_count = count_files(msas_folder, ".a3m")
         print(f"   Total: {a3m_count} A3M file(s)", flush=True)
 
     # Stage 3b: AFM Predictions
@@ -307,7 +444,7 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
         os.makedirs(pdbs_folder, exist_ok=True)
 
         # Check if predictions already exist
-        existing_pdbs = len([f for f in os.listdir(pdbs_folder) if f.endswith('.pdb')]) if os.path.exists(pdbs_folder) else 0
+        existing_pdbs = count_files(pdbs_folder, ".pdb")
         if existing_pdbs > 0:
             print(f"   Found {existing_pdbs} existing PDB(s), checking for completeness...", flush=True)
 
@@ -322,8 +459,16 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
             print(f"   ERROR: Failed to run AFM predictions", flush=True)
             return False
 
-        pdb_count = len([f for f in os.listdir(pdbs_folder) if f.endswith('.pdb')])
+        pdb_count = count_files(pdbs_folder, ".pdb")
         print(f"   Total: {pdb_count} PDB file(s)", flush=True)
+
+        # An out-of-memory retry (classify_afm_failure) predicts the inputs
+        # left over with fewer models
+        reduced = sorted(name for name, count in index_existing_pdbs(pdbs_folder).items()
+                         if count < num_models)
+        if reduced:
+            print(f"   WARNING: {len(reduced)} prediction(s) have fewer than {num_models} models "
+                  f"(out-of-memory retry): {', '.join(reduced)}", flush=True)
     else:
         print(f"\n[Stage 3] Skipping AFM predictions (--skip_afm)", flush=True)
         if not os.path.exists(pdbs_folder):
@@ -331,18 +476,20 @@ def run_pipeline(job_id: str, sequences: List[str], output_dir: str,
             return False
 
     # Stage 4: Assembly
-    print(f"\n[Stage 4] Running combinatorial assembly...", flush=True)
-    if not run_assembly(subunits_json_path, pdbs_folder, assembly_output):
-        print(f"   ERROR: Failed to run assembly", flush=True)
-        return False
-
-    # Check for results
-    assembled_results = os.path.join(assembly_output, "assembled_results")
-    if os.path.exists(assembled_results):
-        result_pdbs = [f for f in os.listdir(assembled_results) if f.endswith('.pdb')]
-        print(f"   Generated {len(result_pdbs)} assembled model(s)", flush=True)
+    if skip_assembly:
+        print(f"\n[Stage 4] Skipping assembly (--skip_assembly)", flush=True)
     else:
-        print(f"   Warning: No assembled_results folder found", flush=True)
+        print(f"\n[Stage 4] Running combinatorial assembly...", flush=True)
+        if not run_assembly(subunits_json_path, pdbs_folder, assembly_output):
+            print(f"   ERROR: Failed to run assembly", flush=True)
+            return False
+
+        # Check for results
+        assembled_results = os.path.join(assembly_output, "assembled_results")
+        if os.path.exists(assembled_results):
+            print(f"   Generated {count_files(assembled_results, '.pdb')} assembled model(s)", flush=True)
+        else:
+            print(f"   Warning: No assembled_results folder found", flush=True)
 
     elapsed = time.time() - start_time
     hours, remainder = divmod(int(elapsed), 3600)
@@ -382,7 +529,9 @@ def main():
         skip_afm=args.skip_afm,
         max_af_size=args.max_af_size,
         num_models=args.num_models,
-        msa_mode=args.msa_mode
+        msa_mode=args.msa_mode,
+        msa_cache_dir=args.msa_cache_dir,
+        skip_assembly=args.skip_assembly
     )
 
     sys.exit(0 if success else 1)
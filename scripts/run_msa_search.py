@@ -15,30 +15,69 @@ This is part of the CombFold clean pipeline architecture:
 """
 
 import argparse
+import atexit
+import fcntl
+import functools
 import glob
+import hashlib
 import os
 import shutil
+import stat
 import subprocess
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 # Default database location
 DEFAULT_DB_PATH = os.environ.get("COLABFOLD_DB", "/cache/colabfold_db")
 
+# Seconds to wait for a GPU server to exit before killing it
+GPU_SERVER_STOP_TIMEOUT = 10
 
-def get_msa_status(fasta_name: str, output_folder: str) -> str:
+# Timeout per searched FASTA file (1 hour)
+SEARCH_TIMEOUT = 3600
+
+# Lines of colabfold_search output kept for error messages
+OUTPUT_TAIL_LINES = 50
+
+# File in the database folder recording that check_database() passed
+DB_OK_SENTINEL = ".combfold_db_ok"
+
+# Subfolder of the output folder holding per-chain A3M files (--unique-chains)
+CHAINS_FOLDER = ".chains"
+
+# Subfolder of the output folder in which the unique chains are searched
+CHAINS_SEARCH_FOLDER = ".chains_search"
+
+# Concurrent colabfold_search runs sharing the GPU servers, so that one run's
+# CPU alignment stages overlap with the other's GPU searches
+GPU_CONCURRENT_SEARCHES = 2
+
+# Queries per colabfold_search run in batched mode
+DEFAULT_SHARD_SIZE = 64
+
+
+def get_msa_status(fasta_name: str, output_folder: str, existing_msas: Optional[Set[str]] = None) -> str:
     """
     Check MSA generation status for a FASTA file.
 
     Args:
         fasta_name: FASTA filename (without extension)
         output_folder: Output folder containing MSAs
+        existing_msas: Names with an MSA in output_folder, from
+            index_existing_msas(); avoids checking the files one by one
 
     Returns:
         'completed': A3M file exists
         'not_started': No MSA found
     """
+    if existing_msas is not None:
+        return 'completed' if fasta_name in existing_msas else 'not_started'
+
     if not os.path.exists(output_folder):
         return 'not_started'
 
@@ -56,6 +95,43 @@ def get_msa_status(fasta_name: str, output_folder: str) -> str:
     return 'not_started'
 
 
+def index_existing_msas(output_folder: str) -> Set[str]:
+    """
+    Find the FASTA names with an MSA in the output folder, in one listing.
+
+    Matches the A3M locations checked by get_msa_status().
+
+    Args:
+        output_folder: Output folder containing MSAs
+
+    Returns:
+        Names (without extension) for which get_msa_status() is 'completed'
+    """
+    existing = set()
+    try:
+        with os.scandir(output_folder) as it:
+            for entry in it:
+                name = entry.name
+                if name.endswith(".a3m"):
+                    existing.add(name[:-len(".a3m")])
+                    if name.endswith("_env.a3m"):
+                        existing.add(name[:-len("_env.a3m")])
+                elif entry.is_dir() and os.path.exists(os.path.join(entry.path, f"{name}.a3m")):
+                    existing.add(name)
+    except FileNotFoundError:
+        pass
+    return existing
+
+
+def list_a3m_files(folder: str) -> Set[str]:
+    """Get the names of the A3M files in a folder (empty if it is missing)."""
+    try:
+        with os.scandir(folder) as it:
+            return {entry.name for entry in it if entry.name.endswith(".a3m")}
+    except FileNotFoundError:
+        return set()
+
+
 def check_database(db_path: str) -> Tuple[bool, str]:
     """
     Verify that the MMseqs2 database exists and is valid.
@@ -66,35 +142,174 @@ def check_database(db_path: str) -> Tuple[bool, str]:
     Returns:
         Tuple of (is_valid, message)
     """
-    if not os.path.exists(db_path):
+    try:
+        db_stat = os.stat(db_path)
+    except FileNotFoundError:
+        db_stat = None
+    if db_stat is None or not stat.S_ISDIR(db_stat.st_mode):
         return False, f"Database directory not found: {db_path}"
+    db_mtime = str(db_stat.st_mtime_ns)
 
-    # Check for UniRef30 index files
-    uniref_patterns = [
-        "uniref30_*_db.idx",
-        "uniref30_*.idx",
-    ]
+    # A database folder that passed the check before, and has not changed
+    # since (files added or removed change its mtime), is still valid
+    sentinel_path = os.path.join(db_path, DB_OK_SENTINEL)
+    try:
+        with open(sentinel_path) as f:
+            if f.read() == db_mtime:
+                return True, "Database OK"
+    except OSError:
+        pass
 
-    found_uniref = False
-    for pattern in uniref_patterns:
-        matches = glob.glob(os.path.join(db_path, pattern))
-        if matches:
-            found_uniref = True
-            break
+    # Check for UniRef30 index files (uniref30_*.idx)
+    with os.scandir(db_path) as it:
+        found_uniref = any(entry.name.startswith("uniref30_") and entry.name.endswith(".idx") for entry in it)
 
     if not found_uniref:
         return False, f"UniRef30 database not found in {db_path}. Run download_weights.sh --db-uniref first."
 
+    try:
+        # Creating the sentinel changes the folder mtime, so read it afterwards
+        with open(sentinel_path, "w") as f:
+            f.write(str(os.stat(db_path).st_mtime_ns))
+    except OSError:
+        pass  # Read-only database folder: check again next time
+
     return True, "Database OK"
 
 
+def find_search_dbs(db_path: str, use_env: bool = True) -> List[str]:
+    """
+    Find the MMseqs2 databases searched by colabfold_search.
+
+    Args:
+        db_path: Path to database directory
+        use_env: Include environmental sequences (ColabFoldDB)
+
+    Returns:
+        Database paths (without extension)
+    """
+    prefixes = ["uniref30_"]
+    if use_env:
+        prefixes.append("colabfold_envdb_")
+
+    with os.scandir(db_path) as it:
+        names = sorted(entry.name[:-len(".dbtype")] for entry in it if entry.name.endswith("_db.dbtype"))
+    return [os.path.join(db_path, name) for prefix in prefixes for name in names if name.startswith(prefix)]
+
+
+def start_gpu_servers(db_path: str, use_env: bool = True) -> List[subprocess.Popen]:
+    """
+    Start an MMseqs2 GPU server per database.
+
+    The servers keep the (GPU-padded) databases loaded on the GPU, so the
+    searches run with --gpu-server 1 do not load them again. They are stopped
+    when this process exits.
+
+    Args:
+        db_path: Path to database directory
+        use_env: Include environmental sequences (ColabFoldDB)
+
+    Returns:
+        The server processes
+    """
+    servers = []
+    for db in find_search_dbs(db_path, use_env):
+        cmd = [
+            "mmseqs", "gpuserver", db,
+            "--max-seqs", "10000",
+            "--db-load-mode", "2",
+            "--prefilter-mode", "1",
+        ]
+        print(f"      Starting GPU server: {' '.join(cmd[:3])}", flush=True)
+        servers.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL))
+
+    atexit.register(stop_gpu_servers, servers)
+    return servers
+
+
+def stop_gpu_servers(servers: List[subprocess.Popen]):
+    """Stop MMseqs2 GPU servers started by start_gpu_servers()."""
+    for server in servers:
+        if server.poll() is None:
+            server.terminate()
+    for server in servers:
+        try:
+            server.wait(timeout=GPU_SERVER_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+class SearchDatabases:
+    """
+    Keeps the search databases loaded while the searches of one
+    run_msa_search.py invocation run.
+
+    Each colabfold_search run otherwise loads the databases again: with
+    gpu_server, MMseqs2 GPU servers keep them loaded on the GPU; with
+    preload, `mmseqs touchdb` reads them into the page cache once, so the
+    runs (which memory-map them with --db-load-mode 2) do not fault them in
+    from disk. The databases are loaded by load(), on the first search, and
+    the servers are stopped when the context exits.
+
+    Args:
+        db_path: Path to database directory
+        use_env: Include environmental sequences (ColabFoldDB)
+        gpu_server: Search on the GPU, with the databases kept loaded by
+            MMseqs2 GPU servers
+        preload: Read the databases into the page cache before searching
+    """
+
+    def __init__(self, db_path: str, use_env: bool = True, gpu_server: bool = False,
+                 preload: bool = False):
+        self.db_path = db_path
+        self.use_env = use_env
+        self.gpu_server = gpu_server
+        self.preload = preload
+        self.gpu_servers: Optional[List[subprocess.Popen]] = None
+        self.loaded = False
+
+    def __enter__(self) -> "SearchDatabases":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self):
+        """Load the databases, once."""
+        if self.loaded:
+            return
+        self.loaded = True
+        if self.preload:
+            for db in find_search_dbs(self.db_path, self.use_env):
+                print(f"      Preloading database: {db}", flush=True)
+                try:
+                    result = subprocess.run(["mmseqs", "touchdb", db], capture_output=True, text=True)
+                except FileNotFoundError:
+                    print(f"      WARNING: mmseqs not found, databases not preloaded", flush=True)
+                    break
+                if result.returncode != 0:
+                    print(f"      WARNING: mmseqs touchdb failed: {result.stderr[:500]}", flush=True)
+        if self.gpu_server:
+            self.gpu_servers = start_gpu_servers(self.db_path, self.use_env)
+
+    def close(self):
+        """Stop the GPU servers."""
+        if self.gpu_servers is not None:
+            stop_gpu_servers(self.gpu_servers)
+            self.gpu_servers = None
+
+
 def run_colabfold_search(
     fasta_path: str,
     output_folder: str,
     db_path: str,
     use_env: bool = True,
     use_templates: bool = False,
-    threads: int = 4
+    threads: int = 4,
+    gpu_server: bool = False,
+    timeout: int = SEARCH_TIMEOUT,
+    existing_msas: Optional[Set[str]] = None
 ) -> Tuple[bool, str]:
     """
     Run colabfold_search on a single FASTA file.
@@ -106,6 +321,10 @@ def run_colabfold_search(
         use_env: Include environmental sequences (ColabFoldDB)
         use_templates: Search for templates (PDB70)
         threads: Number of CPU threads
+        gpu_server: Search on the GPU through the servers of start_gpu_servers()
+        timeout: Timeout in seconds
+        existing_msas: Names with an MSA in output_folder (see
+            get_msa_status())
 
     Returns:
         Tuple of (success, message)
@@ -113,7 +332,7 @@ def run_colabfold_search(
     fasta_name = Path(fasta_path).stem
 
     # Check if already completed
-    status = get_msa_status(fasta_name, output_folder)
+    status = get_msa_status(fasta_name, output_folder, existing_msas)
     if status == 'completed':
         return True, "Already completed (A3M exists)"
 
@@ -126,36 +345,535 @@ def run_colabfold_search(
         db_path,
         output_folder,
         "--threads", str(threads),
+        "--db-load-mode", "2",
     ]
 
     if not use_env:
-        cmd.append("--db1")  # UniRef30 only
+        cmd.extend(["--use-env", "0"])  # UniRef30 only
     if use_templates:
-        cmd.append("--use-templates")
+        cmd.extend(["--use-templates", "1"])
+    if gpu_server:
+        cmd.extend(["--gpu", "1", "--gpu-server", "1"])
 
     print(f"      Command: {' '.join(cmd[:4])} ...", flush=True)
 
+    # Read the (long) MMseqs2 log as it is written, keeping only its tail
+    # for errors, instead of buffering all of it
+    tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    timed_out = threading.Event()
+
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
-            timeout=3600  # 1 hour timeout per search
+            bufsize=1
         )
-
-        if result.returncode == 0:
-            return True, "Success"
-        else:
-            error_msg = result.stderr[:500] if result.stderr else "Unknown error"
-            return False, f"Failed: {error_msg}"
-
-    except subprocess.TimeoutExpired:
-        return False, "Timeout (exceeded 1 hour)"
     except FileNotFoundError:
         return False, "colabfold_search not found. Is MMseqs2 installed?"
     except Exception as e:
         return False, f"Exception: {str(e)}"
 
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill_on_timeout)
+    timer.start()
+    try:
+        for line in proc.stdout:
+            tail.append(line)
+        returncode = proc.wait()
+    except Exception as e:
+        proc.kill()
+        proc.wait()
+        return False, f"Exception: {str(e)}"
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+
+    if timed_out.is_set():
+        return False, f"Timeout (exceeded {timeout // 60} minutes)"
+    if returncode == 0:
+        return True, "Success"
+    error_msg = "".join(tail)[-500:].strip() or "Unknown error"
+    return False, f"Failed: {error_msg}"
+
+
+def read_query_chains(fasta_path: str) -> Tuple[str, ...]:
+    """
+    Read the chain sequences of the query in a FASTA file.
+
+    Each file is parsed once while it is unchanged: the pending scan and the
+    MSA cache lookups all need the chains.
+
+    Args:
+        fasta_path: Path to FASTA file (chains separated by ':')
+
+    Returns:
+        Uppercased chain sequences, in order
+    """
+    return _read_query_chains(fasta_path, os.stat(fasta_path).st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_query_chains(fasta_path: str, mtime_ns: int) -> Tuple[str, ...]:
+    """Parse the query of a FASTA file (cached by path and mtime)."""
+    sequence = []
+    with open(fasta_path) as f:
+        for line in f:
+            if line.startswith(">"):
+                if sequence:
+                    break
+                continue
+            sequence.append(line.strip())
+    return tuple(chain for chain in "".join(sequence).upper().split(":") if chain)
+
+
+@functools.cache
+def chain_hash(sequence: str) -> str:
+    """Get the name of a chain's A3M file in the chains folder."""
+    return hashlib.sha1(sequence.encode()).hexdigest()
+
+
+def query_hash(chains: Tuple[str, ...]) -> str:
+    """Get the name of a query's A3M file in the MSA cache."""
+    return chain_hash(":".join(chains))
+
+
+@contextmanager
+def msa_cache_lock(cache_dir: str) -> Iterator[None]:
+    """
+    Hold the MSA cache lock while restoring A3Ms from or adding them to the
+    cache shared by parallel jobs.
+
+    Args:
+        cache_dir: MSA cache folder
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def restore_cached_msas(fasta_files: List[str], output_folder: str, cache_dir: str,
+                        existing_msas: Set[str]) -> int:
+    """
+    Link the cached A3M files of queries searched by earlier jobs.
+
+    Args:
+        fasta_files: FASTA files to search MSAs for
+        output_folder: Output folder for A3M files
+        cache_dir: MSA cache folder, with A3M files named by query_hash()
+        existing_msas: Names with an MSA in output_folder (see
+            index_existing_msas()); restored names are added
+
+    Returns:
+        Number of A3M files restored
+    """
+    cached = list_a3m_files(cache_dir)
+    restored = 0
+    for fasta_path in fasta_files:
+        fasta_name = Path(fasta_path).stem
+        if fasta_name in existing_msas:
+            continue
+        cached_name = f"{query_hash(read_query_chains(fasta_path))}.a3m"
+        if cached_name in cached:
+            link_or_copy(os.path.join(cache_dir, cached_name), os.path.join(output_folder, f"{fasta_name}.a3m"))
+            existing_msas.add(fasta_name)
+            restored += 1
+    return restored
+
+
+def store_cached_msas(fasta_files: List[str], output_folder: str, cache_dir: str) -> int:
+    """
+    Add the A3M files of the queries missing from the MSA cache to it.
+
+    Args:
+        fasta_files: FASTA files searched
+        output_folder: Output folder for A3M files
+        cache_dir: MSA cache folder, with A3M files named by query_hash()
+
+    Returns:
+        Number of A3M files added
+    """
+    searched = list_a3m_files(output_folder)
+    cached = list_a3m_files(cache_dir)
+    stored = 0
+    for fasta_path in fasta_files:
+        a3m_name = f"{Path(fasta_path).stem}.a3m"
+        if a3m_name not in searched:
+            continue
+        cached_name = f"{query_hash(read_query_chains(fasta_path))}.a3m"
+        if cached_name not in cached:
+            link_or_copy(os.path.join(output_folder, a3m_name), os.path.join(cache_dir, cached_name))
+            cached.add(cached_name)
+            stored += 1
+    return stored
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-link src to dst, or copy it when they are on different filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Copy to a temporary name first, so dst never holds a partial file
+        tmp_path = f"{dst}.tmp{os.getpid()}"
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+
+
+def read_a3m_records(a3m_path: str) -> List[Tuple[str, str]]:
+    """
+    Read the (header, sequence) records of a single-chain A3M file.
+
+    Args:
+        a3m_path: Path to A3M file
+
+    Returns:
+        Records, the query first
+    """
+    with open(a3m_path) as f:
+        text = f.read().replace("\x00", "")
+
+    records = []
+    sequence: List[str] = []
+    for line in text.split("\n"):
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith(">"):
+            if records:
+                records[-1] = (records[-1][0], "".join(sequence))
+            records.append((line, ""))
+            sequence = []
+        elif records:
+            sequence.append(line)
+    if records:
+        records[-1] = (records[-1][0], "".join(sequence))
+    return records
+
+
+def build_complex_a3m(query_chains: Tuple[str, ...], chain_records: Dict[str, List[Tuple[str, str]]]) -> str:
+    """
+    Combine per-chain MSAs into a ColabFold A3M for a (multi-chain) query.
+
+    Uses ColabFold's unpaired layout: a '#lengths<TAB>cardinalities' header,
+    the concatenated query, then each unique chain's MSA padded with gaps for
+    the other chains. There is no paired MSA.
+
+    Args:
+        query_chains: Chain sequences of the query
+        chain_records: A3M records of each unique chain sequence
+
+    Returns:
+        A3M file content
+    """
+    unique_chains = list(dict.fromkeys(query_chains))
+    if len(query_chains) == 1:
+        return "".join(f"{header}\n{sequence}\n" for header, sequence in chain_records[query_chains[0]])
+
+    lines = [
+        "#" + ",".join(str(len(chain)) for chain in unique_chains) + "\t" +
+        ",".join(str(query_chains.count(chain)) for chain in unique_chains)
+    ]
+    if len(unique_chains) > 1:
+        lines.append(">" + "\t".join(str(101 + n) for n in range(len(unique_chains))))
+        lines.append("".join(unique_chains))
+
+    gaps = ["-" * len(chain) for chain in unique_chains]
+    for n, chain in enumerate(unique_chains):
+        before, after = "".join(gaps[:n]), "".join(gaps[n + 1:])
+        for header, sequence in chain_records[chain]:
+            lines.append(header)
+            lines.append(before + sequence + after)
+    return "\n".join(lines) + "\n"
+
+
+def search_batched(
+    fasta_files: List[str],
+    output_folder: str,
+    databases: SearchDatabases,
+    use_templates: bool = False,
+    threads: int = 4,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_parallel: Optional[int] = None,
+    existing_msas: Optional[Set[str]] = None
+) -> Tuple[int, int, int]:
+    """
+    Search the MSAs of all pending FASTA files in shards of queries.
+
+    The unique queries are packed into shards of up to shard_size queries,
+    each searched by one colabfold_search run over a multi-record FASTA (one
+    record per query, named after its FASTA file), so a run loads the
+    databases once for all its queries and a failed run loses one shard.
+    FASTA files with the same query share its A3M.
+
+    Up to max_parallel shards are searched at a time. By default, that is one
+    shard, or GPU_CONCURRENT_SEARCHES shards with GPU servers: colabfold_search
+    runs its UniRef and environmental stages one after the other (the latter
+    starts from the UniRef profile), so the GPU would otherwise idle during
+    each stage's CPU alignment.
+
+    Args:
+        fasta_files: FASTA files to search MSAs for
+        output_folder: Output folder for A3M files
+        databases: Databases to search, loaded on the first search
+        use_templates: Search for templates
+        threads: Number of CPU threads, divided between concurrent runs
+        shard_size: Maximum number of queries per colabfold_search run
+        max_parallel: Maximum number of concurrent runs (see
+            concurrent_searches())
+        existing_msas: Names with an MSA in output_folder (default: from
+            index_existing_msas())
+
+    Returns:
+        Tuple of (completed, failed, skipped)
+    """
+    if existing_msas is None:
+        existing_msas = index_existing_msas(output_folder)
+
+    duplicates: Dict[Tuple[str, ...], List[str]] = {}  # chains -> fasta_names
+    skipped = 0
+    for fasta_path in fasta_files:
+        fasta_name = Path(fasta_path).stem
+        if fasta_name in existing_msas:
+            skipped += 1
+            continue
+        duplicates.setdefault(read_query_chains(fasta_path), []).append(fasta_name)
+
+    if not duplicates:
+        print(f"   All {skipped} A3M file(s) already exist", flush=True)
+        return 0, 0, skipped
+
+    # Search each query under the name of its first FASTA file
+    queries = {fasta_names[0]: chains for chains, fasta_names in duplicates.items()}
+    workers = concurrent_searches(databases, max_parallel)
+    shards = shard_queries(queries, shard_size, workers)
+    num_pending = sum(len(fasta_names) for fasta_names in duplicates.values())
+    print(f"   Searching {num_pending} FASTA file(s), {len(queries)} unique queries, "
+          f"in {len(shards)} shard(s) ({skipped} already done)", flush=True)
+
+    os.makedirs(output_folder, exist_ok=True)
+    databases.load()
+    shard_threads = max(1, threads // workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                search_shard, shard, os.path.join(output_folder, f".batch_{k}"), output_folder,
+                databases, use_templates, min(len(shard), shard_threads)
+            )
+            for k, shard in enumerate(shards)
+        ]
+        for future in futures:
+            future.result()
+
+    completed = 0
+    failed = 0
+    existing_msas = index_existing_msas(output_folder)
+    for fasta_names in duplicates.values():
+        searched = fasta_names[0] in existing_msas
+        for fasta_name in fasta_names:
+            if searched and fasta_name != fasta_names[0]:
+                shutil.copyfile(os.path.join(output_folder, f"{fasta_names[0]}.a3m"),
+                                os.path.join(output_folder, f"{fasta_name}.a3m"))
+            if searched:
+                completed += 1
+            else:
+                print(f"      {fasta_name}: Failed (no A3M)", flush=True)
+                failed += 1
+
+    return completed, failed, skipped
+
+
+def shard_queries(
+    queries: Dict[str, Tuple[str, ...]],
+    shard_size: int,
+    concurrent_searches: int = 1
+) -> List[Dict[str, Tuple[str, ...]]]:
+    """
+    Split queries into shards searched by separate colabfold_search runs.
+
+    Args:
+        queries: Chains of each query, keyed by FASTA file name
+        shard_size: Maximum number of queries per shard
+        concurrent_searches: Number of shards searched at a time; small
+            batches are split further so that every search has a shard
+
+    Returns:
+        Shards of queries, in order
+    """
+    names = list(queries)
+    shard_size = max(1, min(shard_size, -(-len(names) // concurrent_searches)))
+    return [{name: queries[name] for name in names[start:start + shard_size]}
+            for start in range(0, len(names), shard_size)]
+
+
+def search_shard(
+    queries: Dict[str, Tuple[str, ...]],
+    shard_folder: str,
+    output_folder: str,
+    databases: SearchDatabases,
+    use_templates: bool,
+    threads: int
+) -> None:
+    """
+    Search the MSAs of a set of queries with one colabfold_search run.
+
+    Args:
+        queries: Chains of each query, keyed by FASTA file name
+        shard_folder: Folder colabfold_search writes to; a separate folder
+            per concurrent run keeps their numbered outputs apart
+        output_folder: Output folder the A3M files are moved to
+        databases: Databases to search (already loaded)
+        use_templates: Search for templates
+        threads: Number of CPU threads
+    """
+    os.makedirs(shard_folder, exist_ok=True)
+    combined_path = os.path.join(shard_folder, ".batch_queries.fasta")
+    with open(combined_path, "w") as f:
+        f.writelines(f">{fasta_name}\n{':'.join(chains)}\n" for fasta_name, chains in queries.items())
+
+    try:
+        success, message = run_colabfold_search(
+            combined_path, shard_folder, databases.db_path, databases.use_env, use_templates,
+            threads, databases.gpu_server, timeout=SEARCH_TIMEOUT * len(queries), existing_msas=set()
+        )
+    finally:
+        os.remove(combined_path)
+    if not success:
+        print(f"      colabfold_search: {message}", flush=True)
+
+    for i, fasta_name in enumerate(queries):
+        # colabfold_search names outputs after the record names, or numbers
+        # them; a single-record FASTA is named after the file
+        a3m_path = os.path.join(output_folder, f"{fasta_name}.a3m")
+        for candidate in (os.path.join(shard_folder, f"{fasta_name}.a3m"),
+                          os.path.join(shard_folder, f"{i}.a3m"),
+                          os.path.join(shard_folder, ".batch_queries.a3m")):
+            if os.path.exists(candidate):
+                if candidate != a3m_path:
+                    os.replace(candidate, a3m_path)
+                break
+    if shard_folder != output_folder:
+        shutil.rmtree(shard_folder, ignore_errors=True)
+
+
+def search_unique_chains(
+    fasta_files: List[str],
+    output_folder: str,
+    databases: SearchDatabases,
+    use_templates: bool = False,
+    threads: int = 4,
+    chains_folder: Optional[str] = None,
+    existing_msas: Optional[Set[str]] = None
+) -> Tuple[int, int, int]:
+    """
+    Search each unique chain of the FASTA files once, then build their A3Ms.
+
+    Chains shared by several FASTA files (e.g. a subunit in all its pairs) are
+    searched once, in a single colabfold_search run over a combined FASTA.
+    Per-chain A3Ms are kept in {chains_folder}/{sha1}.a3m and reused by later
+    runs. The search itself runs in a private folder of output_folder, and
+    each new chain A3M is then linked into chains_folder, so a chains folder
+    shared by parallel jobs never holds partial or numbered outputs.
+
+    Args:
+        fasta_files: FASTA files to search MSAs for
+        output_folder: Output folder for A3M files
+        databases: Databases to search, loaded on the first search
+        use_templates: Search for templates
+        threads: Number of CPU threads
+        chains_folder: Folder of the per-chain A3Ms (default:
+            {output_folder}/.chains)
+        existing_msas: Names with an MSA in output_folder (default: from
+            index_existing_msas())
+
+    Returns:
+        Tuple of (completed, failed, skipped)
+    """
+    if existing_msas is None:
+        existing_msas = index_existing_msas(output_folder)
+    if chains_folder is None:
+        chains_folder = os.path.join(output_folder, CHAINS_FOLDER)
+    os.makedirs(chains_folder, exist_ok=True)
+
+    pending: Dict[str, Tuple[str, ...]] = {}  # fasta_name -> chains
+    skipped = 0
+    for fasta_path in fasta_files:
+        fasta_name = Path(fasta_path).stem
+        if fasta_name in existing_msas:
+            skipped += 1
+            continue
+        pending[fasta_name] = read_query_chains(fasta_path)
+
+    if not pending:
+        print(f"   All {skipped} A3M file(s) already exist", flush=True)
+        return 0, 0, skipped
+
+    unique_chains = list(dict.fromkeys(chain for chains in pending.values() for chain in chains))
+    searched_chains = list_a3m_files(chains_folder)
+    to_search = [chain for chain in unique_chains if f"{chain_hash(chain)}.a3m" not in searched_chains]
+    print(f"   {len(pending)} FASTA file(s) to search, {len(unique_chains)} unique chain(s), "
+          f"{len(to_search)} not searched yet", flush=True)
+
+    if to_search:
+        search_folder = os.path.join(output_folder, CHAINS_SEARCH_FOLDER)
+        os.makedirs(search_folder, exist_ok=True)
+        combined_path = os.path.join(search_folder, "_unique_chains.fasta")
+        with open(combined_path, "w") as f:
+            f.writelines(f">{chain_hash(chain)}\n{chain}\n" for chain in to_search)
+
+        databases.load()
+        success, message = run_colabfold_search(
+            combined_path, search_folder, databases.db_path, databases.use_env, use_templates,
+            threads, databases.gpu_server, timeout=SEARCH_TIMEOUT * len(to_search), existing_msas=set()
+        )
+        if not success:
+            print(f"      colabfold_search: {message}", flush=True)
+
+        # colabfold_search names outputs after the record names, or numbers them
+        for i, chain in enumerate(to_search):
+            for candidate in (f"{chain_hash(chain)}.a3m", f"{i}.a3m"):
+                searched_path = os.path.join(search_folder, candidate)
+                if os.path.exists(searched_path):
+                    link_or_copy(searched_path, os.path.join(chains_folder, f"{chain_hash(chain)}.a3m"))
+                    break
+        shutil.rmtree(search_folder, ignore_errors=True)
+
+    completed = 0
+    failed = 0
+    chain_records: Dict[str, List[Tuple[str, str]]] = {}
+    for fasta_name, chains in pending.items():
+        a3m_path = os.path.join(output_folder, f"{fasta_name}.a3m")
+        if len(chains) == 1:
+            # The chain's A3M is the monomer's A3M: link it instead of parsing
+            # and rewriting it (a copy, when linking fails, stays in the kernel)
+            try:
+                link_or_copy(os.path.join(chains_folder, f"{chain_hash(chains[0])}.a3m"), a3m_path)
+            except FileNotFoundError:
+                print(f"      {fasta_name}: Failed (chain MSA missing)", flush=True)
+                failed += 1
+                continue
+            completed += 1
+            continue
+
+        try:
+            for chain in chains:
+                if chain not in chain_records:
+                    chain_records[chain] = read_a3m_records(
+                        os.path.join(chains_folder, f"{chain_hash(chain)}.a3m"))
+        except FileNotFoundError:
+            print(f"      {fasta_name}: Failed (chain MSA missing)", flush=True)
+            failed += 1
+            continue
+
+        with open(a3m_path, "w") as f:
+            f.write(build_complex_a3m(chains, chain_records))
+        completed += 1
+
+    return completed, failed, skipped
+
 
 def process_all_fastas(
     fastas_folder: str,
@@ -163,7 +881,14 @@ def process_all_fastas(
     db_path: str,
     use_env: bool = True,
     use_templates: bool = False,
-    threads: int = 4
+    threads: int = 4,
+    gpu_server: bool = False,
+    unique_chains: bool = False,
+    batch: bool = True,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_parallel: Optional[int] = None,
+    preload_db: bool = False,
+    msa_cache_dir: Optional[str] = None
 ) -> Tuple[int, int, int]:
     """
     Process all FASTA files in a folder.
@@ -175,6 +900,19 @@ def process_all_fastas(
         use_env: Include environmental sequences
         use_templates: Search for templates
         threads: Number of CPU threads
+        gpu_server: Search on the GPU, with the databases kept loaded by
+            MMseqs2 GPU servers
+        unique_chains: Search each unique chain once (see search_unique_chains())
+        batch: Search the FASTA files in shards of queries, instead of one
+            colabfold_search run per file
+        shard_size: Maximum number of queries per colabfold_search run in
+            batched mode
+        max_parallel: Maximum number of concurrent colabfold_search runs
+            (default: 1, or 2 with gpu_server)
+        preload_db: Read the databases into the page cache before the first
+            search (see SearchDatabases)
+        msa_cache_dir: MSA cache folder shared by jobs: A3Ms of queries found
+            there are linked instead of searched, and new ones are added to it
 
     Returns:
         Tuple of (completed, failed, skipped)
@@ -188,41 +926,172 @@ def process_all_fastas(
 
     print(f"   Found {len(fasta_files)} FASTA file(s)", flush=True)
 
+    chains_folder = None
+    existing_msas = index_existing_msas(output_folder)
+    # The cache lock is only held while linking A3Ms from and to the cache:
+    # parallel jobs search concurrently, even if their queries overlap
+    if msa_cache_dir:
+        chains_folder = msa_cache_dir
+        os.makedirs(output_folder, exist_ok=True)
+        with msa_cache_lock(msa_cache_dir):
+            restored = restore_cached_msas(fasta_files, output_folder, msa_cache_dir, existing_msas)
+        if restored:
+            print(f"   Restored {restored} A3M file(s) from {msa_cache_dir}", flush=True)
+
+    with SearchDatabases(db_path, use_env, gpu_server, preload_db) as databases:
+        if unique_chains:
+            results = search_unique_chains(fasta_files, output_folder, databases, use_templates,
+                                           threads, chains_folder, existing_msas)
+        elif batch:
+            results = search_batched(fasta_files, output_folder, databases, use_templates, threads,
+                                     shard_size, max_parallel, existing_msas)
+        else:
+            results = search_each(fasta_files, output_folder, databases, use_templates, threads,
+                                  max_parallel, existing_msas)
+
+    # Unpaired A3Ms built by --unique-chains are not cached: a later job
+    # searching the paired MSA must not reuse them
+    if msa_cache_dir and not unique_chains:
+        with msa_cache_lock(msa_cache_dir):
+            stored = store_cached_msas(fasta_files, output_folder, msa_cache_dir)
+        if stored:
+            print(f"   Added {stored} A3M file(s) to {msa_cache_dir}", flush=True)
+
+    return results
+
+
+def search_each(
+    fasta_files: List[str],
+    output_folder: str,
+    databases: SearchDatabases,
+    use_templates: bool = False,
+    threads: int = 4,
+    max_parallel: Optional[int] = None,
+    existing_msas: Optional[Set[str]] = None
+) -> Tuple[int, int, int]:
+    """
+    Search the MSA of each FASTA file with its own colabfold_search run.
+
+    Args:
+        fasta_files: FASTA files to search MSAs for
+        output_folder: Output folder for A3M files
+        databases: Databases to search, loaded on the first search
+        use_templates: Search for templates
+        threads: Number of CPU threads, divided between concurrent runs
+        max_parallel: Maximum number of concurrent runs (see
+            concurrent_searches())
+        existing_msas: Names with an MSA in output_folder (default: from
+            index_existing_msas())
+
+    Returns:
+        Tuple of (completed, failed, skipped)
+    """
+    if existing_msas is None:
+        existing_msas = index_existing_msas(output_folder)
+
     completed = 0
     failed = 0
     skipped = 0
 
-    for i, fasta_path in enumerate(fasta_files, 1):
-        fasta_name = Path(fasta_path).stem
-        print(f"\n   [{i}/{len(fasta_files)}] Searching MSA for {fasta_name}...", flush=True)
-
+    pending = []
+    for fasta_path in fasta_files:
         # Check if already processed
-        status = get_msa_status(fasta_name, output_folder)
-        if status == 'completed':
-            print(f"      Skipping (A3M already exists)", flush=True)
+        if Path(fasta_path).stem in existing_msas:
             skipped += 1
-            continue
+        else:
+            pending.append(fasta_path)
 
-        # Run search
-        success, message = run_colabfold_search(
-            fasta_path,
-            output_folder,
-            db_path,
-            use_env,
-            use_templates,
-            threads
-        )
+    if not pending:
+        print(f"   All {skipped} A3M file(s) already exist", flush=True)
+        return 0, 0, skipped
 
-        if success:
-            print(f"      Completed: {message}", flush=True)
-            completed += 1
-        else:
-            print(f"      Failed: {message}", flush=True)
-            failed += 1
+    workers = min(concurrent_searches(databases, max_parallel), len(pending))
+    print(f"   Searching {len(pending)} FASTA file(s), {workers} at a time ({skipped} already done)",
+          flush=True)
+
+    databases.load()
+    search_threads = max(1, threads // workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                search_file, fasta_path, output_folder, databases, use_templates, search_threads,
+                # Concurrent runs must not share their working folder
+                os.path.join(output_folder, f".search_{Path(fasta_path).stem}") if workers > 1 else None
+            ): Path(fasta_path).stem
+            for fasta_path in pending
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            success, message = future.result()
+            if success:
+                print(f"   [{i}/{len(pending)}] {futures[future]}: Completed: {message}", flush=True)
+                completed += 1
+            else:
+                print(f"   [{i}/{len(pending)}] {futures[future]}: Failed: {message}", flush=True)
+                failed += 1
 
     return completed, failed, skipped
 
 
+def search_file(
+    fasta_path: str,
+    output_folder: str,
+    databases: SearchDatabases,
+    use_templates: bool,
+    threads: int,
+    search_folder: Optional[str] = None
+) -> Tuple[bool, str]:
+    """
+    Search the MSA of one FASTA file.
+
+    Args:
+        fasta_path: Path to FASTA file
+        output_folder: Output folder for A3M files
+        databases: Databases to search (already loaded)
+        use_templates: Search for templates
+        threads: Number of CPU threads
+        search_folder: Folder colabfold_search writes to, when it must not run
+            in the output folder; the A3M is moved to the output folder
+
+    Returns:
+        Tuple of (success, message)
+    """
+    if search_folder is None:
+        return run_colabfold_search(fasta_path, output_folder, databases.db_path, databases.use_env,
+                                    use_templates, threads, databases.gpu_server, existing_msas=set())
+
+    fasta_name = Path(fasta_path).stem
+    try:
+        success, message = run_colabfold_search(fasta_path, search_folder, databases.db_path,
+                                                databases.use_env, use_templates, threads,
+                                                databases.gpu_server, existing_msas=set())
+        # colabfold_search names the output after the file, or numbers it
+        for candidate in (f"{fasta_name}.a3m", "0.a3m"):
+            if os.path.exists(os.path.join(search_folder, candidate)):
+                os.replace(os.path.join(search_folder, candidate),
+                           os.path.join(output_folder, f"{fasta_name}.a3m"))
+                break
+    finally:
+        shutil.rmtree(search_folder, ignore_errors=True)
+    return success, message
+
+
+def concurrent_searches(databases: SearchDatabases, max_parallel: Optional[int] = None) -> int:
+    """
+    Get the number of colabfold_search runs to run at a time.
+
+    Args:
+        databases: Databases to search
+        max_parallel: Requested number of concurrent runs (None: one run, or
+            GPU_CONCURRENT_SEARCHES with GPU servers)
+
+    Returns:
+        Number of concurrent runs
+    """
+    if max_parallel is not None:
+        return max(1, max_parallel)
+    return GPU_CONCURRENT_SEARCHES if databases.gpu_server else 1
+
+
 def parse_args():
     """Parse command-line arguments."""
     parser = argparse.ArgumentParser(
@@ -238,6 +1107,12 @@ Examples:
 
   # With template search
   python3 run_msa_search.py fastas/ msas/ --db /cache/colabfold_db --templates
+
+  # Search each chain shared by several FASTA files once (unpaired MSAs)
+  python3 run_msa_search.py fastas/ msas/ --db /cache/colabfold_db --unique-chains
+
+  # GPU search (MMseqs2 GPU build, databases created with GPU padding)
+  python3 run_msa_search.py fastas/ msas/ --db /cache/colabfold_db --gpu-server
         """
     )
     parser.add_argument(
@@ -264,6 +1139,39 @@ Examples:
         "--threads", type=int, default=4,
         help="Number of CPU threads (default: 4)"
     )
+    parser.add_argument(
+        "--gpu-server", action="store_true",
+        help="Search on the GPU, keeping the databases loaded in MMseqs2 GPU servers "
+             "(requires the MMseqs2 GPU build and GPU-padded databases)"
+    )
+    parser.add_argument(
+        "--unique-chains", action="store_true",
+        help="Search each unique chain once and build unpaired multimer A3Ms from the "
+             "per-chain MSAs (much less search work, but no paired MSA)"
+    )
+    parser.add_argument(
+        "--no-batch", action="store_true",
+        help="Run colabfold_search once per FASTA file instead of once for all of them"
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+        help=f"Maximum number of queries per colabfold_search run (default: {DEFAULT_SHARD_SIZE})"
+    )
+    parser.add_argument(
+        "--max-parallel", type=int, default=None,
+        help="Maximum number of concurrent colabfold_search runs, sharing --threads "
+             "(default: 1, or 2 with --gpu-server)"
+    )
+    parser.add_argument(
+        "--msa-cache-dir", type=str, default=None,
+        help="MSA cache folder shared by jobs: A3Ms of queries (and, with --unique-chains, "
+             "chains) searched before are reused from it, and new ones are added to it"
+    )
+    parser.add_argument(
+        "--preload-db", action="store_true",
+        help="Read the databases into memory (mmseqs touchdb) once before searching, "
+             "so the colabfold_search runs do not load them from disk (needs enough RAM)"
+    )
     return parser.parse_args()
 
 
@@ -279,6 +1187,16 @@ def main():
     print(f"   Use Env:   {not args.no_env}", flush=True)
     print(f"   Templates: {args.templates}", flush=True)
     print(f"   Threads:   {args.threads}", flush=True)
+    print(f"   GPU:       {args.gpu_server}", flush=True)
+    print(f"   Unique:    {args.unique_chains}", flush=True)
+    print(f"   Batch:     {not args.no_batch}", flush=True)
+    if not args.no_batch:
+        print(f"   Shard:     {args.shard_size} queries", flush=True)
+    print(f"   Preload:   {args.preload_db}", flush=True)
+    if args.max_parallel is not None:
+        print(f"   Parallel:  {args.max_parallel} searches", flush=True)
+    if args.msa_cache_dir:
+        print(f"   MSA cache: {args.msa_cache_dir}", flush=True)
 
     # Validate inputs
     if not os.path.exists(args.fastas_folder):
@@ -303,7 +1221,14 @@ def main():
         args.db,
         use_env=not args.no_env,
         use_templates=args.templates,
-        threads=args.threads
+        threads=args.threads,
+        gpu_server=args.gpu_server,
+        unique_chains=args.unique_chains,
+        batch=not args.no_batch,
+        shard_size=args.shard_size,
+        max_parallel=args.max_parallel,
+        preload_db=args.preload_db,
+        msa_cache_dir=args.msa_cache_dir
     )
 
     print(f"\n{'='*60}", flush=True)
@@ -8,7 +8,7 @@ into smaller domains that can be predicted within the size limit.
 
 The script can be used:
 1. Standalone: python3 split_large_subunits.py input.json -o output.json
-2. As a module: from split_large_subunits import split_subunits_for_af_size
+2. As a module: from split_large_subunits import maybe_split_subunits_for_af_size
 
 Domain splitting strategy:
 - Calculates the maximum domain size based on max_af_size / 2
@@ -19,10 +19,60 @@ Domain splitting strategy:
 
 import argparse
 import json
-import math
 import sys
-from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_json(path: str):
+    """Read a JSON file, using orjson when available."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_json(data) -> bytes:
+    """Serialize data as 2-space indented JSON, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode()
+
+
+def _stream_dump(path: str, data: dict):
+    """
+    Write a dict as 2-space indented JSON one entry at a time.
+
+    Produces the same document as dump_json(), but only one entry is
+    serialized in memory at a time.
+
+    Args:
+        path: Output file path
+        data: Dictionary to write
+    """
+    if not data:
+        with open(path, 'wb') as f:
+            f.write(b"{}")
+        return
+
+    with open(path, 'wb', buffering=1 << 20) as f:
+        f.write(b"{")
+        separator = b"\n  "
+        for key, value in data.items():
+            f.write(separator)
+            if orjson is not None:
+                f.write(orjson.dumps(key))
+            else:
+                f.write(json.dumps(key).encode())
+            f.write(b": ")
+            f.write(dump_json(value).replace(b"\n", b"\n  "))
+            separator = b",\n  "
+        f.write(b"\n}")
 
 
 def calculate_domain_size(sequence_length: int, max_af_size: int) -> Tuple[int, int]:
@@ -44,11 +94,11 @@ def calculate_domain_size(sequence_length: int, max_af_size: int) -> Tuple[int,
     if sequence_length <= max_domain_size:
         return sequence_length, 1
 
-    # Calculate minimum number of domains needed
-    num_domains = math.ceil(sequence_length / max_domain_size)
+    # Calculate minimum number of domains needed (integer ceiling division)
+    num_domains = -(-sequence_length // max_domain_size)
 
     # Calculate even domain size (may be slightly smaller than max)
-    domain_size = math.ceil(sequence_length / num_domains)
+    domain_size = -(-sequence_length // num_domains)
 
     return domain_size, num_domains
 
@@ -65,36 +115,20 @@ def split_sequence(sequence: str, domain_size: int, overlap: int = 0) -> List[Tu
     Returns:
         List of (start_res, domain_sequence) tuples (1-indexed start)
     """
-    domains = []
     seq_len = len(sequence)
 
     if seq_len <= domain_size:
         return [(1, sequence)]
 
-    pos = 0
-    domain_num = 0
-
-    while pos < seq_len:
-        # Calculate end position for this domain
-        end = min(pos + domain_size, seq_len)
-
-        # Extract domain sequence
-        domain_seq = sequence[pos:end]
-
-        # Start residue is 1-indexed
-        start_res = pos + 1
-
-        domains.append((start_res, domain_seq))
-
-        # Move to next domain (with potential overlap)
-        pos = end - overlap
-        domain_num += 1
-
-        # Safety check to prevent infinite loop
-        if overlap >= domain_size:
-            break
+    step = domain_size - overlap
+    if step <= 0:
+        # Overlap would never advance: keep only the first domain
+        return [(1, sequence[:domain_size])]
 
-    return domains
+    # Domain starts advance by (domain_size - overlap); the last domain is the
+    # first one that reaches the end of the sequence
+    return [(pos + 1, sequence[pos:pos + domain_size])
+            for pos in range(0, seq_len - overlap, step)]
 
 
 def split_subunit(subunit: dict, max_af_size: int, overlap: int = 0) -> List[dict]:
@@ -108,23 +142,28 @@ def split_subunit(subunit: dict, max_af_size: int, overlap: int = 0) -> List[dic
     Returns:
         List of subunit dictionaries (1 if no split needed, multiple if split)
     """
-    sequence = subunit["sequence"]
-    seq_len = len(sequence)
-    original_start = subunit.get("start_res", 1)
-
     # Calculate domain size
-    domain_size, num_domains = calculate_domain_size(seq_len, max_af_size)
+    domain_size, num_domains = calculate_domain_size(len(subunit["sequence"]), max_af_size)
 
     if num_domains == 1:
         # No split needed
         return [subunit]
 
+    return _split_domains(subunit, domain_size, overlap)
+
+
+def _split_domains(subunit: dict, domain_size: int, overlap: int = 0) -> List[dict]:
+    """Build the domain subunits of a subunit for an already computed domain size."""
+    original_start = subunit.get("start_res", 1)
+
     # Split the sequence
-    domains = split_sequence(sequence, domain_size, overlap)
+    domains = split_sequence(subunit["sequence"], domain_size, overlap)
 
     # Create new subunits for each domain
     split_subunits = []
     base_name = subunit["name"]
+    # Domains share one immutable chain_names tuple (serialized as a list)
+    chain_names = tuple(subunit["chain_names"])
 
     for i, (rel_start, domain_seq) in enumerate(domains):
         # Calculate absolute start residue
@@ -132,7 +171,7 @@ def split_subunit(subunit: dict, max_af_size: int, overlap: int = 0) -> List[dic
 
         domain_subunit = {
             "name": f"{base_name}_d{i+1}",
-            "chain_names": subunit["chain_names"].copy(),
+            "chain_names": chain_names,
             "start_res": abs_start,
             "sequence": domain_seq
         }
@@ -155,8 +194,16 @@ def split_subunits_for_af_size(subunits: dict, max_af_size: int = 1800,
         verbose: Print splitting information
 
     Returns:
-        New dictionary with split subunits
+        New dictionary with split subunits, or the input dictionary itself
+        if no subunit needs splitting
     """
+    if not needs_splitting(subunits, max_af_size):
+        return subunits
+    return _split_all(subunits, max_af_size, overlap, verbose)
+
+
+def _split_all(subunits: dict, max_af_size: int, overlap: int, verbose: bool) -> dict:
+    """Split every oversized subunit, for callers that already checked needs_splitting()."""
     result = {}
     max_domain_size = max_af_size // 2
 
@@ -164,12 +211,11 @@ def split_subunits_for_af_size(subunits: dict, max_af_size: int = 1800,
         seq_len = len(subunit["sequence"])
 
         if seq_len > max_domain_size:
+            domain_size, num_domains = calculate_domain_size(seq_len, max_af_size)
             if verbose:
-                domain_size, num_domains = calculate_domain_size(seq_len, max_af_size)
                 print(f"  Splitting {name}: {seq_len}aa -> {num_domains} domains of ~{domain_size}aa")
 
-            split_subs = split_subunit(subunit, max_af_size, overlap)
-            for sub in split_subs:
+            for sub in _split_domains(subunit, domain_size, overlap):
                 result[sub["name"]] = sub
         else:
             result[name] = subunit
@@ -177,6 +223,43 @@ def split_subunits_for_af_size(subunits: dict, max_af_size: int = 1800,
     return result
 
 
+def _oversized(subunits: dict, max_domain_size: int) -> Iterator[Tuple[str, int]]:
+    """Yield (name, sequence length) for each subunit longer than max_domain_size."""
+    for name, subunit in subunits.items():
+        seq_len = len(subunit["sequence"])
+        if seq_len > max_domain_size:
+            yield name, seq_len
+
+
+def maybe_split_subunits_for_af_size(subunits: dict, max_af_size: int = 1800,
+                                      overlap: int = 0, verbose: bool = True,
+                                      header: Optional[str] = None) -> Tuple[dict, bool]:
+    """
+    Split subunits only if any of them exceeds the maximum AFM prediction size.
+
+    Combines needs_splitting() and split_subunits_for_af_size() so that the
+    common no-split case costs a single early-exit scan.
+
+    Args:
+        subunits: Dictionary of subunits (name -> subunit dict)
+        max_af_size: Maximum combined size for AFM predictions (default: 1800)
+        overlap: Number of overlapping residues between domains (default: 0)
+        verbose: Print splitting information
+        header: Optional line printed (when verbose) before splitting starts
+
+    Returns:
+        Tuple of (subunits, was_split); subunits is returned unchanged when
+        no splitting was needed
+    """
+    if not needs_splitting(subunits, max_af_size):
+        return subunits, False
+
+    if verbose and header:
+        print(header, flush=True)
+
+    return _split_all(subunits, max_af_size, overlap, verbose), True
+
+
 def needs_splitting(subunits: dict, max_af_size: int = 1800) -> bool:
     """
     Check if any subunit needs splitting.
@@ -188,13 +271,7 @@ def needs_splitting(subunits: dict, max_af_size: int = 1800) -> bool:
     Returns:
         True if any subunit exceeds max_af_size / 2
     """
-    max_domain_size = max_af_size // 2
-
-    for subunit in subunits.values():
-        if len(subunit["sequence"]) > max_domain_size:
-            return True
-
-    return False
+    return next(_oversized(subunits, max_af_size // 2), None) is not None
 
 
 def get_splitting_summary(subunits: dict, max_af_size: int = 1800) -> Dict[str, dict]:
@@ -211,17 +288,14 @@ def get_splitting_summary(subunits: dict, max_af_size: int = 1800) -> Dict[str,
     max_domain_size = max_af_size // 2
     summary = {}
 
-    for name, subunit in subunits.items():
-        seq_len = len(subunit["sequence"])
-
-        if seq_len > max_domain_size:
-            domain_size, num_domains = calculate_domain_size(seq_len, max_af_size)
-            summary[name] = {
-                "original_length": seq_len,
-                "num_domains": num_domains,
-                "domain_size": domain_size,
-                "exceeds_by": seq_len - max_domain_size
-            }
+    for name, seq_len in _oversized(subunits, max_domain_size):
+        domain_size, num_domains = calculate_domain_size(seq_len, max_af_size)
+        summary[name] = {
+            "original_length": seq_len,
+            "num_domains": num_domains,
+            "domain_size": domain_size,
+            "exceeds_by": seq_len - max_domain_size
+        }
 
     return summary
 
@@ -241,8 +315,7 @@ def process_subunits_file(input_path: str, output_path: str = None,
         Processed subunits dictionary
     """
     # Load input
-    with open(input_path, 'r') as f:
-        subunits = json.load(f)
+    subunits = load_json(input_path)
 
     print(f"Loaded {len(subunits)} subunit(s) from {input_path}")
 
@@ -259,18 +332,41 @@ def process_subunits_file(input_path: str, output_path: str = None,
 
         # Perform splitting
         print("\nSplitting...")
-        result = split_subunits_for_af_size(subunits, max_af_size, overlap)
+        result = _split_all(subunits, max_af_size, overlap, verbose=True)
         print(f"\nResult: {len(result)} subunit(s)")
 
     # Output
     if output_path:
-        with open(output_path, 'w') as f:
-            json.dump(result, f, indent=2)
+        _stream_dump(output_path, result)
         print(f"\nSaved to: {output_path}")
 
     return result
 
 
+def check_subunits_file(input_path: str, max_af_size: int = 1800):
+    """
+    Print which subunits of a subunits.json file would be split.
+
+    Args:
+        input_path: Path to input subunits.json
+        max_af_size: Maximum combined size for AFM predictions
+    """
+    subunits = load_json(input_path)
+
+    summary = get_splitting_summary(subunits, max_af_size)
+
+    if not summary:
+        print(f"No subunits need splitting (max domain size: {max_af_size // 2}aa)")
+    else:
+        print(f"Subunits that would be split (max domain size: {max_af_size // 2}aa):\n")
+        for name, info in summary.items():
+            print(f"  {name}:")
+            print(f"    Original length: {info['original_length']}aa")
+            print(f"    Exceeds by: {info['exceeds_by']}aa")
+            print(f"    Would split into: {info['num_domains']} domains of ~{info['domain_size']}aa")
+            print()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Split large protein sequences into domains for CombFold",
@@ -324,46 +420,35 @@ Domain splitting strategy:
 
     args = parser.parse_args()
 
-    if not Path(args.input_file).exists():
+    # The input is only opened once: a missing file is reported from the
+    # FileNotFoundError instead of a separate exists() check
+    try:
+        if args.check:
+            check_subunits_file(args.input_file, args.max_af_size)
+            return
+
+        # Determine output path
+        output_path = args.output
+        if args.in_place:
+            output_path = args.input_file
+
+        # Process the file
+        result = process_subunits_file(
+            args.input_file,
+            output_path,
+            args.max_af_size,
+            args.overlap
+        )
+    except FileNotFoundError as e:
+        if e.filename != args.input_file:
+            raise
         print(f"Error: Input file not found: {args.input_file}")
         sys.exit(1)
 
-    if args.check:
-        # Just show what would be split
-        with open(args.input_file, 'r') as f:
-            subunits = json.load(f)
-
-        summary = get_splitting_summary(subunits, args.max_af_size)
-
-        if not summary:
-            print(f"No subunits need splitting (max domain size: {args.max_af_size // 2}aa)")
-        else:
-            print(f"Subunits that would be split (max domain size: {args.max_af_size // 2}aa):\n")
-            for name, info in summary.items():
-                print(f"  {name}:")
-                print(f"    Original length: {info['original_length']}aa")
-                print(f"    Exceeds by: {info['exceeds_by']}aa")
-                print(f"    Would split into: {info['num_domains']} domains of ~{info['domain_size']}aa")
-                print()
-        return
-
-    # Determine output path
-    output_path = args.output
-    if args.in_place:
-        output_path = args.input_file
-
-    # Process the file
-    result = process_subunits_file(
-        args.input_file,
-        output_path,
-        args.max_af_size,
-        args.overlap
-    )
-
     # If no output file specified, print to stdout
     if not output_path:
-        print("\n--- Result (JSON) ---")
-        print(json.dumps(result, indent=2))
+        print("\n--- Result (JSON) ---", flush=True)
+        sys.stdout.buffer.write(dump_json(result) + b"\n")
 
 
 if __name__ == "__main__":